@@ -1,7 +1,10 @@
-import types
+from array import array
+
 import util
+from compiler import CompiledProgram
+from genome import Genome
 
-class Agent():
+class Agent(object):
 	VIEW_RANGE = 3
 
 	def __init__(self, game_map, start_tile, program_tree):
@@ -11,272 +14,285 @@ class Agent():
 		----
 			game_map: A tile map representing the game environment.
 			start_tile: The starting tile for the agent.
-			program_tree: The tree of actions defining the behaviour of the agent.
+			program_tree: The tree of actions defining the behaviour of the agent, as a Genome
+				or a ProgramTree (which is converted to a Genome).
 
 		'''
 
 		self.game_map = game_map
-		self.tile = start_tile
-		self.program_tree = program_tree
+		# index of the tile the agent is on
+		self.index = start_tile.index
+		# index of the tile the guard is on, as seen by the agent - kept up to date by the simulation
+		self.guard_position = game_map.guard_position
+		if (program_tree is not None) and not isinstance(program_tree, Genome):
+			program_tree = Genome.from_tree(program_tree)
+		self.genome = program_tree
+		# index of the current node in the genome
+		self.pc = 0
+		self._program = None
+
+	@property
+	def tile(self):
+		''' The tile the agent is on. '''
+
+		return self.game_map.tile(self.index)
+
+	@property
+	def program_tree(self):
+		''' A ProgramTree with the structure of the agent's genome. '''
+
+		if self.genome is None:
+			return None
+
+		return self.genome.to_tree()
 
 	def copy(self):
 		''' Create a copy of the agent. '''
 
-		return Agent(self.game_map, self.game_map.agent_start, self.program_tree.copy())
+		return Agent(self.game_map, self.game_map.agent_start, self.genome.copy())
 
 	def reset(self):
 		''' Reset the agent to its starting position and the top of the program tree. '''
 
-		self.tile = self.game_map.agent_start
-		self.program_tree.curr_node = self.program_tree.start_node
+		self._move_to(self.game_map.agent_start_index)
+		self.pc = 0
 
 	def update(self):
-		# create and execute move method for next action
-
-		if not self.program_tree:
-			return
+		''' Execute the next action of the program tree.
 
-		# while the current node is conditional, evaluate the condition and update the
-		# current location in the program tree accordingly (makes nested conditionals possible)
-		while self.program_tree.curr_node.conditional:
-			result = self._gen_and_exec()
+		Conditionals are evaluated until an action is reached (makes nested conditionals possible),
+		then the action is executed and the current node moves on to the action's next node.
 
-			if result:
-				self.program_tree.curr_node = self.program_tree.curr_node.true_branch
-			else:
-				self.program_tree.curr_node = self.program_tree.curr_node.false_branch
+		'''
 
-		# execute action
-		self._gen_and_exec()
+		if not self.genome:
+			return
 
-		# update current node of program tree
-		self.program_tree.curr_node = self.program_tree.curr_node.next_node
-		# if at end of program tree, go back to the start
-		if self.program_tree.curr_node is None:
-			self.program_tree.curr_node = self.program_tree.start_node
+		program = self._program
+		if program is None:
+			program = self._program = CompiledProgram(self.genome)
 
-	def _gen_and_exec(self):
-		''' Generate a `my_move` method given the current state of the program tree.
-		Execute the method and return its result. '''
+		# evaluate conditionals and execute the action they lead to
+		resolve = program.resolve[self.pc] or program.resolver(self.pc)
+		action = self.pc + resolve(self)
+		# update current node - back to the start at the end of a branch
+		self.pc = program.next[action]
 
-		method_decl = util.create_move(self.program_tree.curr_node)
-		exec(method_decl)
-		self.my_move = types.MethodType(my_move, self)
-		return self.my_move()
+	def _move_to(self, index):
+		''' Place the agent on the tile at an index. '''
 
-	def my_move(self):
-		pass
+		self.index = index
+		self.game_map.agent_position = index
 
 	def move_north(self):
 		''' Tell agent to move up one tile. '''
 
-		if self.tile.north and self.tile.north.traversable:
-			self.tile.has_agent = False
-			self.tile = self.tile.north
-			self.tile.has_agent = True
+		north = self.index - self.game_map.cols
+		if north >= 0 and self.game_map.traversable[north]:
+			self._move_to(north)
 
 	def move_south(self):
 		''' Tell agent to move down one tile. '''
 
-		if self.tile.south and self.tile.south.traversable:
-			self.tile.has_agent = False
-			self.tile = self.tile.south
-			self.tile.has_agent = True
+		south = self.index + self.game_map.cols
+		if south < len(self.game_map.traversable) and self.game_map.traversable[south]:
+			self._move_to(south)
 
 	def move_west(self):
 		''' Tell agent to move left one tile. '''
 
-		if self.tile.left and self.tile.left.traversable:
-			self.tile.has_agent = False
-			self.tile = self.tile.left
-			self.tile.has_agent = True
+		if (self.index % self.game_map.cols) > 0 and self.game_map.traversable[self.index - 1]:
+			self._move_to(self.index - 1)
 
 	def move_east(self):
 		''' Tell agent to move right one tile. '''
 
-		if self.tile.right and self.tile.right.traversable:
-			self.tile.has_agent = False
-			self.tile = self.tile.right
-			self.tile.has_agent = True
+		if (self.index % self.game_map.cols) < (self.game_map.cols - 1) and self.game_map.traversable[self.index + 1]:
+			self._move_to(self.index + 1)
 
 	def obstacle_north(self):
 		''' Check if an obstacle is located immediately up. '''
 
-		if not self.tile.north:
-			return True
-
-		return not self.tile.north.traversable
+		north = self.index - self.game_map.cols
+		return north < 0 or not self.game_map.traversable[north]
 
 	def obstacle_south(self):
 		''' Check if an obstacle is located immediately down. '''
 
-		if not self.tile.south:
-			return True
-
-		return not self.tile.south.traversable
+		south = self.index + self.game_map.cols
+		return south >= len(self.game_map.traversable) or not self.game_map.traversable[south]
 
 	def obstacle_west(self):
 		''' Check if an obstacle is located immediately to the left. '''
 
-		if not self.tile.left:
-			return True
-
-		return not self.tile.left.traversable
+		return (self.index % self.game_map.cols) == 0 or not self.game_map.traversable[self.index - 1]
 
 	def obstacle_east(self):
 		''' Check if an obstacle is located immediately to the right. '''
 
-		if not self.tile.right:
-			return True
-
-		return not self.tile.right.traversable
+		return (self.index % self.game_map.cols) == (self.game_map.cols - 1) or not self.game_map.traversable[self.index + 1]
 
 	def see_guard_west(self):
 		''' Check if the agent can see the guard to the left within its view range. '''
 
-		tiles = self.game_map.tiles_within(self.tile, 'left', Agent.VIEW_RANGE)
-
-		for tile in tiles:
-			if tile.has_guard:
-				return True
-
-		return False
+		return self.game_map.in_view(self.index, self.guard_position, 'left', Agent.VIEW_RANGE)
 
 	def see_guard_east(self):
 		''' Check if the agent can see the guard to the right within its view range. '''
 
-		tiles = self.game_map.tiles_within(self.tile, 'right', Agent.VIEW_RANGE)
-
-		for tile in tiles:
-			if tile.has_guard:
-				return True
-
-		return False
+		return self.game_map.in_view(self.index, self.guard_position, 'right', Agent.VIEW_RANGE)
 
 	def see_guard_north(self):
 		''' Check if the agent can see the guard to the north within its view range. '''
 
-		tiles = self.game_map.tiles_within(self.tile, 'north', Agent.VIEW_RANGE)
-
-		for tile in tiles:
-			if tile.has_guard:
-				return True
-
-		return False
+		return self.game_map.in_view(self.index, self.guard_position, 'north', Agent.VIEW_RANGE)
 
 	def see_guard_south(self):
 		''' Check if the agent can see the guard to the south within its view range. '''
 
-		tiles = self.game_map.tiles_within(self.tile, 'south', Agent.VIEW_RANGE)
-
-		for tile in tiles:
-			if tile.has_guard:
-				return True
-
-		return False
+		return self.game_map.in_view(self.index, self.guard_position, 'south', Agent.VIEW_RANGE)
 
 	def goal_west(self):
 		''' Check if the goal is somewhere to the left of the agent. '''
 
-		return self.tile.position.x > self.game_map.goal.position.x
+		return (self.index % self.game_map.cols) > (self.game_map.goal_index % self.game_map.cols)
 
 	def goal_east(self):
 		''' Check if the goal is somewhere to the right of the agent. '''
 
-		return self.tile.position.x < self.game_map.goal.position.x
+		return (self.index % self.game_map.cols) < (self.game_map.goal_index % self.game_map.cols)
 
 	def goal_north(self):
 		''' Check if the goal is somewhere to the north of the agent. '''
 
-		return self.tile.position.y < self.game_map.goal.position.y
+		# rows are numbered from the top of the map
+		return (self.index // self.game_map.cols) > (self.game_map.goal_index // self.game_map.cols)
 
 	def goal_south(self):
 		''' Check if the goal is somewhere to the south of the agent. '''
 
-		return self.tile.position.y > self.game_map.goal.position.y
+		return (self.index // self.game_map.cols) < (self.game_map.goal_index // self.game_map.cols)
 
 # ------------------------------------------------------------------------------- #
 
 class Guard(Agent):
-	def __init__(self, game_map, start_tile, move=0):
-		''' Create a new guard object. '''
+	def __init__(self, game_map, start_tile, move=0, program_tree=None):
+		''' Create a new guard object.
+
+		args
+		----
+			game_map: A tile map representing the game environment.
+			start_tile: The starting tile for the guard.
+			move: Length of the guard's random walk. If 0, the guard doesn't move.
+			program_tree: A movement pattern to use instead of generating a random walk.
+
+		'''
 
 		# create program tree if movement required
-		if move > 0:
+		if (program_tree is None) and (move > 0):
 			program_tree = util.random_guard_movement(move)
-			Agent.__init__(self, game_map, start_tile, program_tree)
-		else:
-			Agent.__init__(self, game_map, start_tile, None)
+
+		Agent.__init__(self, game_map, start_tile, program_tree)
+		self.start_index = start_tile.index
+		self.game_map.guard_position = self.index
 
 		self._mark_surrounding_tiles()
 
+	def _move_to(self, index):
+		''' Place the guard on the tile at an index, moving its detection zone with it. '''
+
+		self._mark_surrounding_tiles(mark=False)
+		self.index = index
+		self.game_map.guard_position = index
+		self._mark_surrounding_tiles()
+
+	def detection_zone(self):
+		''' Return the indices of all tiles currently marked as detection zones by the guard. '''
+
+		detection = self.game_map.detection
+		cols = self.game_map.cols
+		row, col = divmod(self.index, cols)
+
+		# only the guard's surroundings and its starting tile can be marked
+		candidates = [self.start_index]
+		for r in range(max(row - 1, 0), min(row + 2, self.game_map.rows)):
+			for c in range(max(col - 1, 0), min(col + 2, cols)):
+				candidates.append(r * cols + c)
+
+		return [index for index in set(candidates) if detection[index]]
+
 	def _mark_surrounding_tiles(self, mark=True):
 		''' Mark (or unmark) surrounding tiles as detection areas. '''
 
+		detection = self.game_map.detection
+		cols = self.game_map.cols
+		rows = self.game_map.rows
+		row, col = divmod(self.index, cols)
+
 		# mark surrounding tiles as detection zones
-		north = self.tile.north
-		if north:
-			north.detection = mark
-			if north.left:
-				north.left.detection = mark
-			if north.right:
-				north.right.detection = mark
-		south = self.tile.south
-		if south:
-			south.detection = mark
-			if south.left:
-				south.left.detection = mark
-			if south.right:
-				south.right.detection = mark
-		if self.tile.left:
-			self.tile.left.detection = mark
-		if self.tile.right:
-			self.tile.right.detection = mark
+		for r in range(max(row - 1, 0), min(row + 2, rows)):
+			for c in range(max(col - 1, 0), min(col + 2, cols)):
+				if (r, c) != (row, col):
+					detection[r * cols + c] = mark
 
-	def move_north(self):
-		''' Tell guard to move up one tile. '''
+# ------------------------------------------------------------------------------- #
 
-		self._mark_surrounding_tiles(mark=False)
+class GuardSchedule():
+	def __init__(self, guard):
+		''' Precompute the movement of a guard.
 
-		if self.tile.north and self.tile.north.traversable:
-			self.tile.has_guard = False
-			self.tile = self.tile.north
-			self.tile.has_guard = True
+		The guard's movement doesn't depend on the agent, so its position and detection zone
+		can be worked out for every step ahead of time. The guard is walked (on a copy of its
+		map) from its starting position until it returns to a state it has been in before;
+		from then on its movement repeats.
 
-		self._mark_surrounding_tiles()
+		`positions[phase]` and `detection[phase]` are the guard's tile and the set of tiles in
+		its detection zone after its `phase`th move; use `phase` to find the phase for a step.
 
-	def move_south(self):
-		''' Tell guard to move down one tile. '''
+		args
+		----
+			guard: The Guard to precompute the movement of. It is not changed.
 
-		self._mark_surrounding_tiles(mark=False)
+		'''
 
-		if self.tile.south and self.tile.south.traversable:
-			self.tile.has_guard = False
-			self.tile = self.tile.south
-			self.tile.has_guard = True
+		self.start_index = guard.start_index
+		self.positions = []
+		self.detection = []
 
-		self._mark_surrounding_tiles()
+		# walk a copy of the guard, starting from the map's initial detection zones
+		game_map = guard.game_map.copy()
+		game_map.detection = array('b', [0]) * len(game_map.detection)
+		game_map.detection[self.start_index] = 1
+		walker = Guard(game_map, game_map.tile(self.start_index), program_tree=guard.genome)
 
-	def move_west(self):
-		''' Tell guard to move left one tile. '''
+		seen = {} # guard state -> phase
+		while True:
+			state = (walker.index, walker.pc, game_map.detection[self.start_index])
+			if state in seen:
+				break
 
-		self._mark_surrounding_tiles(mark=False)
+			seen[state] = len(self.positions)
+			self.positions.append(walker.index)
+			self.detection.append(frozenset(walker.detection_zone()))
+			walker.update()
 
-		if self.tile.left and self.tile.left.traversable:
-			self.tile.has_guard = False
-			self.tile = self.tile.left
-			self.tile.has_guard = True
+		# phase at which the guard's movement starts repeating, and the length of the repeat
+		self.loop_start = seen[state]
+		self.loop_length = len(self.positions) - self.loop_start
 
-		self._mark_surrounding_tiles()
+	def phase(self, step):
+		''' Return the phase of the guard after it has made `step` moves. '''
 
-	def move_east(self):
-		''' Tell guard to move right one tile. '''
+		if step < self.loop_start:
+			return step
 
-		self._mark_surrounding_tiles(mark=False)
+		return self.loop_start + ((step - self.loop_start) % self.loop_length)
 
-		if self.tile.right and self.tile.right.traversable:
-			self.tile.has_guard = False
-			self.tile = self.tile.right
-			self.tile.has_guard = True
+	def next_phase(self, phase):
+		''' Return the phase following `phase`. '''
 
-		self._mark_surrounding_tiles()
+		phase += 1
+		if phase == len(self.positions):
+			return self.loop_start
+
+		return phase
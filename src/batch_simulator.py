@@ -0,0 +1,241 @@
+from array import array
+
+import numpy
+
+import util
+from agent import Agent
+from genome import NUM_ACTIONS, OPCODES
+from simulator import Simulator
+
+# outcome codes used while simulating
+RUNNING = 0
+GOAL = 1
+CAUGHT = 2
+STEP_LIMIT = 3
+OUTCOMES = {GOAL: Simulator.GOAL, CAUGHT: Simulator.CAUGHT, STEP_LIMIT: Simulator.STEP_LIMIT}
+
+class BatchSimulator():
+	def __init__(self, environment, guard_schedule, max_steps):
+		''' Create a simulator which runs a whole population of agents at once.
+
+		Every agent's program is encoded as instruction arrays, and agent positions and
+		program counters are kept as NumPy vectors, so each step of every agent is a handful
+		of vectorised operations. Results are the same as running each agent with a `Simulator`,
+		including skipping the repeats of any loop an agent gets stuck in.
+
+		args
+		----
+			environment: The Map the agents are in.
+			guard_schedule: The GuardSchedule of the guard in the environment, or None.
+			max_steps: Maximum number of game loops to execute before finishing the simulation. Must be positive.
+
+		'''
+
+		if max_steps <= 0:
+			raise ValueError('BatchSimulator needs a step limit.')
+
+		self.environment = environment
+		self.guard_schedule = guard_schedule
+		self.max_steps = max_steps
+		# total steps run by the agents of every `evaluate` (not counting the repeats of loops skipped)
+		self.steps_run = 0
+
+		num_tiles = len(environment.chars)
+		tiles = numpy.arange(num_tiles)
+		cols = environment.cols
+		goal_col = environment.goal_index % cols
+		goal_row = environment.goal_index // cols
+
+		# destination of each move from each tile (the tile itself if the move is blocked)
+		# the last row is for agents with empty programs, which never move
+		self.moves = numpy.empty((NUM_ACTIONS + 1, num_tiles), dtype=numpy.int32)
+		self.moves[NUM_ACTIONS] = tiles
+		for action, direction in enumerate(('north', 'south', 'left', 'right')):
+			for index in range(num_tiles):
+				neighbour = environment.neighbour(index, direction)
+				blocked = neighbour < 0 or not environment.traversable[neighbour]
+				self.moves[action, index] = index if blocked else neighbour
+
+		self.is_goal = numpy.array(environment.is_goal, dtype=bool)
+		self.goal_col = goal_col
+		self.goal_row = goal_row
+
+		# guard phases - a map with no guard has a single phase, using the map's own detection zones
+		if guard_schedule:
+			guard_positions = guard_schedule.positions
+			detection = guard_schedule.detection
+			self.loop_start = guard_schedule.loop_start
+		else:
+			guard_positions = [-1]
+			detection = [frozenset(index for index in range(num_tiles) if environment.detection[index])]
+			self.loop_start = 0
+		num_phases = len(guard_positions)
+
+		self.detection = numpy.zeros((num_phases, num_tiles), dtype=bool)
+		for phase in range(num_phases):
+			self.detection[phase, list(detection[phase])] = True
+
+		# result of every query, for every guard phase and tile
+		self.queries = numpy.zeros((num_phases, len(util.QUERIES), num_tiles), dtype=bool)
+		static = {
+			'north_blocked': self.moves[0] == tiles,
+			'south_blocked': self.moves[1] == tiles,
+			'west_blocked': self.moves[2] == tiles,
+			'east_blocked': self.moves[3] == tiles,
+			'goal_west': (tiles % cols) > goal_col,
+			'goal_east': (tiles % cols) < goal_col,
+			'goal_north': (tiles // cols) > goal_row,
+			'goal_south': (tiles // cols) < goal_row
+		}
+		for query, values in static.items():
+			self.queries[:, OPCODES[query] - NUM_ACTIONS] = values
+
+		# the guard is seen looking in a direction from the tiles in view of it looking the opposite way
+		for query, direction in (('guard_west', 'right'), ('guard_east', 'left'), ('guard_north', 'south'), ('guard_south', 'north')):
+			for phase in range(num_phases):
+				if guard_positions[phase] >= 0:
+					seen_from = environment.indices_within(guard_positions[phase], direction, Agent.VIEW_RANGE)
+					self.queries[phase, OPCODES[query] - NUM_ACTIONS, seen_from] = True
+
+	def evaluate(self, genomes):
+		''' Simulate an agent for each genome, all at once.
+
+		args
+		----
+			genomes: The genomes of the agents.
+
+		return
+		------
+			A list of (outcome, distance_from_goal, steps) tuples, one per genome.
+
+		'''
+
+		ops, true_branch, false_branch, next_node, starts = _encode(genomes)
+		num_agents = len(genomes)
+		num_phases = self.detection.shape[0]
+
+		pcs = starts.copy()
+		positions = numpy.empty(num_agents, dtype=numpy.int32)
+		positions.fill(self.environment.agent_start_index)
+		outcomes = numpy.zeros(num_agents, dtype=numpy.int8)
+		steps = numpy.empty(num_agents, dtype=numpy.int64)
+		steps.fill(self.max_steps)
+		running = numpy.arange(num_agents)
+
+		# cycle detection (Brent's algorithm): each agent's state is compared with a saved state,
+		# which is replaced whenever the number of steps since it was saved reaches a power of two
+		num_instructions = len(ops)
+		saved_states = numpy.empty(num_agents, dtype=numpy.int64)
+		saved_states.fill(-1)
+		saved_steps = numpy.zeros(num_agents, dtype=numpy.int64)
+		powers = numpy.ones(num_agents, dtype=numpy.int64)
+		# steps left before each agent reaches the step limit
+		remaining = numpy.empty(num_agents, dtype=numpy.int64)
+		remaining.fill(self.max_steps)
+
+		phase = 0
+		step = 0
+		while len(running) > 0:
+			self.steps_run += len(running)
+
+			# evaluate conditionals until every running agent has reached an action
+			pc = pcs[running]
+			while True:
+				op = ops[pc]
+				conditional = numpy.nonzero(op >= NUM_ACTIONS)[0]
+				if len(conditional) == 0:
+					break
+
+				cond_pc = pc[conditional]
+				result = self.queries[phase, op[conditional] - NUM_ACTIONS, positions[running[conditional]]]
+				pc[conditional] = numpy.where(result, true_branch[cond_pc], false_branch[cond_pc])
+
+			# execute actions, then move on to the next node
+			positions[running] = self.moves[op, positions[running]]
+			pcs[running] = next_node[pc]
+
+			phase += 1
+			if phase == num_phases:
+				phase = self.loop_start
+			step += 1
+
+			# check for the end of each simulation
+			agent_positions = positions[running]
+			reached_goal = self.is_goal[agent_positions]
+			caught = self.detection[phase, agent_positions] & ~reached_goal
+			outcomes[running[reached_goal]] = GOAL
+			outcomes[running[caught]] = CAUGHT
+			steps[running[reached_goal | caught]] = step
+			running = running[~(reached_goal | caught)]
+			remaining[running] -= 1
+
+			# skip whole repeats of any loops found - the state after them is the current state
+			states = (positions[running].astype(numpy.int64) * num_instructions + pcs[running]) * num_phases + phase
+			looped = running[states == saved_states[running]]
+			if len(looped) > 0:
+				remaining[looped] %= step - saved_steps[looped]
+
+			save = (step - saved_steps[running]) == powers[running]
+			saved = running[save]
+			saved_states[saved] = states[save]
+			saved_steps[saved] = step
+			powers[saved] *= 2
+
+			out_of_steps = remaining[running] == 0
+			outcomes[running[out_of_steps]] = STEP_LIMIT
+			running = running[~out_of_steps]
+
+		cols = self.environment.cols
+		distances = numpy.abs(positions % cols - self.goal_col) + numpy.abs(positions // cols - self.goal_row)
+
+		return [(OUTCOMES[outcome], int(distance), int(agent_steps)) for outcome, distance, agent_steps in zip(outcomes, distances, steps)]
+
+# ------------------------------------------------------------------------------- #
+
+def _encode(genomes):
+	''' Encode genomes as instruction arrays.
+
+	All genomes are laid out one after another. For instruction `i`, `ops[i]` is its
+	opcode, `true_branch[i]`/`false_branch[i]` are the instructions a conditional branches to,
+	and `next_node[i]` is the instruction to run after an action (the start of the agent's
+	program at the end of a branch). An empty genome is encoded as a single instruction with
+	opcode -1, which does nothing.
+
+	return
+	------
+		The `ops`, `true_branch`, `false_branch` and `next_node` arrays, and the start
+		instruction of each genome.
+
+	'''
+
+	all_ops = array('B')
+	all_sizes = array('I')
+	starts = []
+	empty = []
+	for genome in genomes:
+		starts.append(len(all_ops))
+		if not genome:
+			empty.append(len(all_ops))
+			all_ops.append(0)
+			all_sizes.append(1)
+		else:
+			all_ops.extend(genome.ops)
+			all_sizes.extend(genome.sizes)
+
+	ops = numpy.frombuffer(all_ops, dtype=numpy.uint8).astype(numpy.int8)
+	ops[empty] = -1
+	sizes = numpy.frombuffer(all_sizes, dtype=numpy.uintc).astype(numpy.int32)
+	starts = numpy.array(starts, dtype=numpy.int32)
+
+	index = numpy.arange(len(ops), dtype=numpy.int32)
+	# start of the genome each instruction belongs to
+	lengths = numpy.diff(numpy.append(starts, len(ops)))
+	program_starts = numpy.repeat(starts, lengths)
+
+	conditional = ops >= NUM_ACTIONS
+	true_branch = numpy.where(conditional, index + 1, -1)
+	# only conditionals (which always have a true branch) look up the size of the next node
+	false_branch = numpy.where(conditional, index + 1 + sizes[numpy.minimum(index + 1, len(ops) - 1)], -1)
+	next_node = numpy.where(conditional, -1, numpy.where(sizes > 1, index + 1, program_starts))
+
+	return ops, true_branch.astype(numpy.int32), false_branch.astype(numpy.int32), next_node.astype(numpy.int32), starts
@@ -0,0 +1,256 @@
+from random import randint, random, seed
+from timeit import default_timer
+import argparse
+import gc
+import glob
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+import util
+from agent import Agent
+from genetics import Experiment
+
+# map used by the micro-benchmarks
+BENCHMARK_MAP = 'maps/5.txt'
+# population sizes of the generation benchmarks, in full and quick runs
+POPULATION_SIZES = (100, 1000, 10000)
+QUICK_POPULATION_SIZES = (100,)
+# number of times each generation benchmark is run - the best time is kept
+GENERATION_REPEAT = 5
+# short generation benchmarks are run again until they have taken at least this many seconds
+GENERATION_MIN_SECONDS = 1.0
+# default fraction a result can be worse than the baseline by before it's a regression
+TOLERANCE = 0.1
+# the same, for the generation benchmarks - whole generations vary more from run to run
+GENERATION_TOLERANCE = 0.25
+# version of the results file format
+VERSION = 1
+
+def run_benchmarks(quick=False, random_seed=0):
+	''' Run every benchmark.
+
+	Micro-benchmarks time agent simulation steps and the tree and genetic operations.
+	Generation benchmarks time a whole generation of an Experiment (evaluating the population
+	and generating the next one) on every map in 'maps/', for each population size.
+
+	args
+	----
+		quick: True to only run the smallest generation benchmarks.
+		random_seed: Seed for the random programs and populations benchmarked, so runs are comparable.
+
+	return
+	------
+		A dict of the results (see `save`). `results['benchmarks']` maps each benchmark's name to
+		a dict of its 'value', 'unit', whether higher values are better and its default 'tolerance'
+		(see `compare`).
+
+	'''
+
+	benchmarks = {}
+
+	def record(name, value, unit, higher_is_better=False, tolerance=TOLERANCE):
+		benchmarks[name] = {'value': value, 'unit': unit, 'higher_is_better': higher_is_better, 'tolerance': tolerance}
+		print '%-40s %12.6g %s' % (name, value, unit)
+
+	environment = util.create_map(BENCHMARK_MAP)
+
+	# simulation steps
+	seed(random_seed)
+	agents = [Agent(environment, environment.agent_start, util.random_program_tree(randint(5, 10))) for i in range(100)]
+	def run_agents():
+		for agent in agents:
+			agent.reset()
+			for step in range(100):
+				agent.update()
+	record('agent.update', (len(agents) * 100) / _time_per_call(run_agents, 1), 'steps/s', True)
+
+	# tree operations
+	seed(random_seed)
+	trees = [util.random_program_tree(randint(20, 40)) for i in range(100)]
+	record('program_tree.copy', _time_per_call(_cycle(trees, lambda tree: tree.copy()), 1000), 's/call')
+	record('program_tree.random_node', _time_per_call(_cycle(trees, lambda tree: tree.random_node()), 10000), 's/call')
+	record('util.random_program_tree', _time_per_call(lambda: util.random_program_tree(randint(5, 10)), 1000), 's/call')
+
+	# genetic operations, on a population with random fitness values
+	log_folder = tempfile.mkdtemp()
+	try:
+		seed(random_seed)
+		experiment = Experiment(log_folder + '/', BENCHMARK_MAP, 100, 25, guard_move=20, iterations=1)
+		fitness_values = [[agent, random() * 25] for agent in experiment.population]
+		selector = experiment._selector(fitness_values)
+		new_population = []
+		def crossover():
+			experiment._crossover(selector, new_population)
+			del new_population[:]
+		def mutation():
+			experiment._mutation(selector, new_population)
+			del new_population[:]
+		record('experiment.crossover', _time_per_call(crossover, 1000), 's/call')
+		record('experiment.mutation', _time_per_call(mutation, 1000), 's/call')
+		record('experiment.random_agent_by_fitness', _time_per_call(lambda: experiment._random_agent_by_fitness(fitness_values), 1000), 's/call')
+	finally:
+		shutil.rmtree(log_folder, True)
+
+	# whole generations
+	for map_file in sorted(glob.glob('maps/*.txt')):
+		map_name = os.path.splitext(os.path.basename(map_file))[0]
+		for population_size in (QUICK_POPULATION_SIZES if quick else POPULATION_SIZES):
+			record('generation.map' + map_name + '.' + str(population_size), _time_generation(map_file, population_size, random_seed), 's/generation', tolerance=GENERATION_TOLERANCE)
+
+	return {
+		'version': VERSION,
+		'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+		'python': platform.python_version(),
+		'platform': platform.platform(),
+		'quick': quick,
+		'seed': random_seed,
+		'benchmarks': benchmarks
+	}
+
+def save(results, file_name):
+	''' Write benchmark results (see `run_benchmarks`) to a JSON file. '''
+
+	util.write_atomically(file_name, json.dumps(results, indent=1, sort_keys=True) + '\n')
+
+def load(file_name):
+	''' Read benchmark results written by `save`. '''
+
+	with open(file_name) as in_file:
+		results = json.load(in_file)
+
+	if results.get('version') != VERSION:
+		raise ValueError('Unsupported benchmark results version: ' + str(results.get('version')))
+
+	return results
+
+def compare(results, baseline, tolerance=None):
+	''' Compare benchmark results with a baseline, printing the change in each benchmark they share.
+
+	args
+	----
+		results: The results to check (see `run_benchmarks`).
+		baseline: Earlier results to compare them with.
+		tolerance: Fraction a result can be worse than the baseline by before it's a regression.
+			If None, each benchmark's own tolerance is used.
+
+	return
+	------
+		A list of the names of the benchmarks which regressed.
+
+	'''
+
+	regressions = []
+	for name in sorted(results['benchmarks']):
+		if name not in baseline['benchmarks']:
+			continue
+
+		current = results['benchmarks'][name]
+		expected = baseline['benchmarks'][name]['value']
+		# positive changes are improvements
+		change = (current['value'] - expected) / expected if expected else 0.0
+		if not current['higher_is_better']:
+			change = -change
+
+		allowed = tolerance if tolerance is not None else current.get('tolerance', TOLERANCE)
+		regressed = change < -allowed
+		if regressed:
+			regressions.append(name)
+		print '%-40s %12.6g -> %12.6g %s %+7.1f%%%s' % (name, expected, current['value'], current['unit'], change * 100, '  REGRESSION' if regressed else '')
+
+	return regressions
+
+def _time_per_call(function, calls, repeat=5):
+	''' Return the time a call of a function takes - the best of `repeat` runs of `calls` calls.
+
+	Garbage collection is turned off while timing (as by `timeit`), so collections don't land in some runs only.
+
+	'''
+
+	best = None
+	gc_enabled = gc.isenabled()
+	gc.disable()
+	try:
+		for run in range(repeat):
+			start = default_timer()
+			for call in xrange(calls):
+				function()
+			elapsed = (default_timer() - start) / calls
+			best = elapsed if best is None else min(best, elapsed)
+	finally:
+		if gc_enabled:
+			gc.enable()
+
+	return best
+
+def _cycle(values, function):
+	''' Return a function which calls `function` on each of `values` in turn. '''
+
+	position = [0]
+	def call():
+		value = values[position[0] % len(values)]
+		position[0] += 1
+		return function(value)
+
+	return call
+
+def _time_generation(map_file, population_size, random_seed, repeat=GENERATION_REPEAT):
+	''' Return the time taken to evaluate a random population of an Experiment and generate the next one.
+
+	The experiment is created afresh (from the same seed) for each run, and the best time is kept.
+	There are at least `repeat` runs, and more for short generations (see `GENERATION_MIN_SECONDS`).
+
+	'''
+
+	best = None
+	runs = 0
+	total = 0.0
+	while (runs < repeat) or (total < GENERATION_MIN_SECONDS):
+		seed(random_seed)
+		log_folder = tempfile.mkdtemp()
+		experiment = Experiment(log_folder + '/', map_file, population_size, 25, guard_move=20, iterations=2)
+		stdout = sys.stdout
+		try:
+			# the experiment reports its progress - keep the benchmark output readable
+			sys.stdout = open(os.devnull, 'w')
+			gc.disable()
+			start = default_timer()
+			results = experiment._run_iteration(0)
+			experiment._generate_new_population(results)
+			elapsed = default_timer() - start
+		finally:
+			gc.enable()
+			if sys.stdout is not stdout:
+				sys.stdout.close()
+				sys.stdout = stdout
+			experiment._close_caches()
+			shutil.rmtree(log_folder, True)
+		best = elapsed if best is None else min(best, elapsed)
+		runs += 1
+		total += elapsed
+
+	return best
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Benchmark simulation, genetic operations and whole generations.')
+	parser.add_argument('--quick', action='store_true', help='only run generation benchmarks for the smallest population')
+	parser.add_argument('--seed', type=int, default=0, help='seed for the benchmarked programs and populations')
+	parser.add_argument('--output', help='file to write the results to, as JSON')
+	parser.add_argument('--compare', metavar='BASELINE', help='results file to compare with - exits with status 1 on a regression')
+	parser.add_argument('--tolerance', type=float, help='fraction any result can be worse than the baseline by (default %s, or %s for generations)' % (TOLERANCE, GENERATION_TOLERANCE))
+	args = parser.parse_args()
+
+	results = run_benchmarks(args.quick, args.seed)
+	if args.output:
+		save(results, args.output)
+
+	if args.compare:
+		print
+		regressions = compare(results, load(args.compare), args.tolerance)
+		if regressions:
+			print len(regressions), 'regression(s):', ', '.join(regressions)
+			sys.exit(1)
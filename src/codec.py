@@ -0,0 +1,181 @@
+from array import array
+import pickle
+import struct
+import sys
+
+import util
+from genome import Genome, NUM_ACTIONS, OPCODE_NAMES
+
+# an encoded genome is a header (magic, format version, number of nodes) followed by one byte per node, in preorder
+MAGIC = 'GPT'
+VERSION = 1
+HEADER = struct.Struct('<3sBI')
+# a file of many genomes is a header (magic, format version, number of genomes) followed by each encoded genome
+CONTAINER_MAGIC = 'GPS'
+CONTAINER_HEADER = struct.Struct('<3sBI')
+
+# flag set in the byte of an action which has a next node - the rest of the byte is the opcode
+HAS_NEXT = 0x80
+
+def dumps(genome):
+	''' Encode a genome (or program tree) as a string.
+
+	Each node is a single byte - its opcode, with `HAS_NEXT` set for an action with a next node.
+	Conditionals always have both branches, so this is enough to recover the tree's structure.
+
+	args
+	----
+		genome: The Genome or ProgramTree to encode.
+
+	return
+	------
+		The encoded genome.
+
+	'''
+
+	if not isinstance(genome, Genome):
+		genome = Genome.from_tree(genome)
+
+	nodes = array('B', genome.ops)
+	for i in range(len(nodes)):
+		if nodes[i] < NUM_ACTIONS and genome.sizes[i] > 1:
+			nodes[i] |= HAS_NEXT
+
+	return HEADER.pack(MAGIC, VERSION, len(nodes)) + nodes.tostring()
+
+def loads(data):
+	''' Decode a genome encoded by `dumps`.
+
+	return
+	------
+		The Genome.
+
+	'''
+
+	genome, end = _decode(data, 0)
+	if end != len(data):
+		raise ValueError('Unexpected data after encoded genome.')
+
+	return genome
+
+def dump(genome, file_name):
+	''' Write an encoded genome (or program tree) to a file. '''
+
+	util.write_atomically(file_name, dumps(genome))
+
+def load(file_name):
+	''' Read an encoded genome from a file. '''
+
+	with open(file_name, 'rb') as in_file:
+		return loads(in_file.read())
+
+def dump_all(genomes, file_name):
+	''' Write many encoded genomes (or program trees) to a single file. '''
+
+	parts = [CONTAINER_HEADER.pack(CONTAINER_MAGIC, VERSION, len(genomes))]
+	parts.extend(dumps(genome) for genome in genomes)
+	util.write_atomically(file_name, ''.join(parts))
+
+def load_all(file_name):
+	''' Read all the genomes from a file written by `dump_all`.
+
+	return
+	------
+		A list of Genomes.
+
+	'''
+
+	with open(file_name, 'rb') as in_file:
+		data = in_file.read()
+
+	if len(data) < CONTAINER_HEADER.size:
+		raise ValueError('Truncated genome file.')
+	magic, version, count = CONTAINER_HEADER.unpack_from(data, 0)
+	if magic != CONTAINER_MAGIC:
+		raise ValueError('Not a genome file.')
+	if version != VERSION:
+		raise ValueError('Unsupported genome file version: ' + str(version))
+
+	genomes = []
+	offset = CONTAINER_HEADER.size
+	for i in range(count):
+		genome, offset = _decode(data, offset)
+		genomes.append(genome)
+
+	if offset != len(data):
+		raise ValueError('Unexpected data after encoded genomes.')
+
+	return genomes
+
+def convert_pickle(pickle_file, file_name=None):
+	''' Convert a pickled ProgramTree (as saved by earlier experiments) to the encoded format.
+
+	args
+	----
+		pickle_file: Name of the pickle file.
+		file_name: Name of the file to write. If None, the pickle file's name with a '.gpt' extension.
+
+	return
+	------
+		The name of the file written.
+
+	'''
+
+	if file_name is None:
+		file_name = pickle_file[:-3] + '.gpt' if pickle_file.endswith('.pk') else pickle_file + '.gpt'
+
+	with open(pickle_file, 'rb') as in_file:
+		program_tree = pickle.load(in_file)
+
+	dump(program_tree, file_name)
+	return file_name
+
+def _decode(data, offset):
+	''' Decode the genome starting at `offset` in `data`.
+
+	return
+	------
+		The Genome, and the offset of the end of its encoding.
+
+	'''
+
+	if len(data) < offset + HEADER.size:
+		raise ValueError('Truncated genome.')
+	magic, version, num_nodes = HEADER.unpack_from(data, offset)
+	if magic != MAGIC:
+		raise ValueError('Not an encoded genome.')
+	if version != VERSION:
+		raise ValueError('Unsupported genome version: ' + str(version))
+
+	start = offset + HEADER.size
+	end = start + num_nodes
+	if len(data) < end:
+		raise ValueError('Truncated genome.')
+
+	ops = array('B', data[start:end])
+	sizes = array('I', [1]) * num_nodes
+	# children always come after their parent in preorder
+	for i in reversed(range(num_nodes)):
+		op = ops[i]
+		if op & HAS_NEXT:
+			ops[i] = op = op & ~HAS_NEXT
+			if (op >= NUM_ACTIONS) or (i + 1 >= num_nodes):
+				raise ValueError('Invalid genome.')
+			sizes[i] += sizes[i + 1]
+		elif op >= NUM_ACTIONS:
+			if op >= len(OPCODE_NAMES):
+				raise ValueError('Invalid genome.')
+			false_i = i + 1 + (sizes[i + 1] if i + 1 < num_nodes else 0)
+			if false_i >= num_nodes:
+				raise ValueError('Invalid genome.')
+			sizes[i] += sizes[i + 1] + sizes[false_i]
+
+	if num_nodes and sizes[0] != num_nodes:
+		raise ValueError('Invalid genome.')
+
+	return Genome(ops, sizes), end
+
+if __name__ == '__main__':
+	# convert the pickle files given on the command line
+	for pickle_file in sys.argv[1:]:
+		print pickle_file, '->', convert_pickle(pickle_file)
@@ -0,0 +1,210 @@
+import util
+
+# maximum number of distinct subtrees to keep compiled code for before the cache is cleared
+CACHE_LIMIT = 100000
+# deepest chain of directly nested conditionals compiled as nested function calls - deeper
+# chains are resolved by a loop instead, so they can't exhaust the stack
+MAX_NESTING = 100
+
+# name of the agent method for each opcode (see `genome.OPCODE_NAMES`)
+_METHODS = [util.ACTION_MAPPINGS.get(name, util.QUERY_MAPPINGS.get(name))[len('self.'):-len('()')] for name in util.ACTIONS + util.QUERIES]
+_NUM_ACTIONS = len(util.ACTIONS)
+
+# (action, child keys...) -> subtree key, so structurally identical subtrees share a key
+_subtree_keys = {}
+# subtree key -> compiled `resolve` function
+_compiled = {}
+# the same, for functions which count the conditionals they evaluate (see `set_counting`)
+_counting_compiled = {}
+# True to compile programs which count the conditionals they evaluate
+_counting = False
+# number of conditionals evaluated by counting programs - a list so compiled code can update it
+_conditional_count = [0]
+
+class CompiledProgram():
+	def __init__(self, genome):
+		''' Compile a program into Python functions.
+
+		For each node (numbered in preorder, as in the genome) a `resolve` function is generated
+		which evaluates the conditionals starting at that node, executes the action they lead to
+		and returns the offset (from the starting node) of the action node executed. Functions
+		are shared between all structurally identical subtrees, and are only generated the first
+		time a node is reached.
+
+		args
+		----
+			genome: The Genome of the program to compile.
+
+		'''
+
+		self.genome = genome
+		num_nodes = len(genome)
+		# index of the node to execute after each action node - 0 (the start node) at the end of a branch
+		self.next = [0] * num_nodes
+		# compiled functions, filled in by `resolver`
+		self.resolve = [None] * num_nodes
+		self.keys = [None] * num_nodes
+		# length of the longest chain of directly nested conditionals starting at each node
+		self.nesting = [0] * num_nodes
+
+		if len(_subtree_keys) > CACHE_LIMIT:
+			clear_cache()
+		# keep hold of the cache the keys belong to, so clearing it can't mix up keys
+		self.cache = _counting_compiled if _counting else _compiled
+		self.counting = _counting
+
+		# key subtrees bottom-up - children always come after their parent in preorder
+		ops = genome.ops
+		sizes = genome.sizes
+		keys = self.keys
+		nesting = self.nesting
+		for i in reversed(range(num_nodes)):
+			if genome.conditional(i):
+				false_i = genome.false_branch(i)
+				keys[i] = _subtree_key((ops[i], keys[i + 1], keys[false_i]))
+				nesting[i] = 1 + max(nesting[i + 1], nesting[false_i])
+			elif sizes[i] > 1:
+				self.next[i] = i + 1
+				keys[i] = _subtree_key((ops[i], keys[i + 1]))
+			else:
+				keys[i] = _subtree_key((ops[i], None))
+
+	def resolver(self, i):
+		''' Return the `resolve` function for node `i`, compiling it if needed.
+
+		The functions of the nested conditionals a function calls are compiled first, deepest first,
+		so compiling doesn't recurse.
+
+		'''
+
+		resolve = self.resolve[i]
+		if resolve is not None:
+			return resolve
+
+		# find the nodes without a function that node i's function needs
+		needed = []
+		stack = [i]
+		genome = self.genome
+		while stack:
+			j = stack.pop()
+			if (self.resolve[j] is not None) or (self.keys[j] in self.cache):
+				continue
+			needed.append(j)
+			if genome.conditional(j) and (self.nesting[j] <= MAX_NESTING):
+				stack.extend(child for child in (genome.true_branch(j), genome.false_branch(j)) if genome.conditional(child))
+
+		# nested conditionals come after their parent in preorder
+		for j in sorted(needed, reverse=True):
+			if self.nesting[j] > MAX_NESTING:
+				_interpret(self, j)
+			else:
+				_compile(self, j)
+
+		for j in needed:
+			self.resolve[j] = self.cache[self.keys[j]]
+		if self.resolve[i] is None:
+			self.resolve[i] = self.cache[self.keys[i]]
+
+		return self.resolve[i]
+
+# ------------------------------------------------------------------------------- #
+
+def clear_cache():
+	''' Forget all compiled subtrees.
+
+	Programs compiled before the cache was cleared keep using the old cache.
+
+	'''
+
+	global _subtree_keys, _compiled, _counting_compiled
+
+	_subtree_keys = {}
+	_compiled = {}
+	_counting_compiled = {}
+
+def set_counting(counting):
+	''' Set whether programs compiled from now on count the conditionals they evaluate (see `conditional_count`).
+
+	Counting programs are compiled (and cached) separately, so programs that don't count run at full speed.
+
+	'''
+
+	global _counting
+
+	_counting = counting
+
+def conditional_count():
+	''' Return the number of conditionals evaluated by counting programs so far, in this process. '''
+
+	return _conditional_count[0]
+
+def _subtree_key(signature):
+	''' Return the key for a subtree with the given (action, child keys...) signature. '''
+
+	subtree_keys = _subtree_keys
+	key = subtree_keys.get(signature)
+	if key is None:
+		key = len(subtree_keys)
+		subtree_keys[signature] = key
+
+	return key
+
+def _compile(program, i):
+	''' Generate the `resolve` function for node `i` of a compiled program and cache it by subtree key. '''
+
+	genome = program.genome
+	namespace = {}
+	method_decl = 'def resolve(self):\n'
+	if not genome.conditional(i):
+		method_decl += '\t' + util.ACTION_MAPPINGS[genome.action(i)] + '\n'
+		method_decl += '\treturn 0\n'
+	else:
+		if program.counting:
+			namespace['counts'] = _conditional_count
+			method_decl += '\tcounts[0] += 1\n'
+		method_decl += '\tif ' + util.QUERY_MAPPINGS[genome.action(i)] + ':\n'
+		for branch, child_i, indent in (('true', genome.true_branch(i), '\t\t'), ('false', genome.false_branch(i), '\t')):
+			offset = str(child_i - i)
+			if genome.conditional(child_i):
+				# nested conditional - call its (shared) compiled function
+				namespace[branch] = program.resolver(child_i)
+				method_decl += indent + 'return ' + offset + ' + ' + branch + '(self)\n'
+			else:
+				# inline the action the branch leads to
+				method_decl += indent + util.ACTION_MAPPINGS[genome.action(child_i)] + '\n'
+				method_decl += indent + 'return ' + offset + '\n'
+
+	exec method_decl in namespace
+	resolve = namespace['resolve']
+	program.cache[program.keys[i]] = resolve
+
+	return resolve
+
+def _interpret(program, i):
+	''' Create a `resolve` function for node `i` of a compiled program which walks its conditionals in a loop,
+	and cache it by subtree key. Used for chains of nested conditionals too deep to compile. '''
+
+	subtree = program.genome.subtree(i)
+	ops = subtree.ops
+	sizes = subtree.sizes
+	methods = _METHODS
+	num_actions = _NUM_ACTIONS
+	counts = _conditional_count if program.counting else None
+
+	def resolve(self):
+		j = 0
+		op = ops[0]
+		while op >= num_actions:
+			if counts is not None:
+				counts[0] += 1
+			if getattr(self, methods[op])():
+				j += 1
+			else:
+				j += 1 + sizes[j + 1]
+			op = ops[j]
+		getattr(self, methods[op])()
+		return j
+
+	program.cache[program.keys[i]] = resolve
+
+	return resolve
@@ -0,0 +1,106 @@
+from collections import OrderedDict
+import hashlib
+import shelve
+
+# version of the results cached - results cached by other versions are ignored
+RESULT_VERSION = 2
+
+class FitnessCache():
+	def __init__(self, environment, guard_schedule, max_steps, capacity=100000, disk_file=None, shared_with=None):
+		''' Create a cache of simulation results.
+
+		Simulations are deterministic, so a genome's result only depends on the genome, the map,
+		the guard's movement and the step limit. Results are kept in memory in least recently used
+		order, and optionally also on disk (using `shelve`) so later runs over the same map can reuse them.
+
+		args
+		----
+			environment: The Map agents are simulated in.
+			guard_schedule: The GuardSchedule of the guard, or None.
+			max_steps: The step limit of the simulations.
+			capacity: Maximum number of results to keep in memory.
+			disk_file: File to keep results in on disk. If None, results are only kept in memory.
+			shared_with: Another FitnessCache (e.g. for another map) to share memory and disk storage with,
+				instead of using `capacity` and `disk_file`. Only that cache closes the storage.
+
+		'''
+
+		self.hits = 0
+		self.misses = 0
+		if shared_with:
+			self.capacity = shared_with.capacity
+			self._results = shared_with._results
+			self._disk = shared_with._disk
+			self._owns_disk = False
+		else:
+			self.capacity = capacity
+			self._results = OrderedDict()
+			self._disk = shelve.open(disk_file, protocol=2) if disk_file else None
+			self._owns_disk = True
+
+		# everything other than the genome that a result depends on
+		guard = None
+		if guard_schedule:
+			guard = (guard_schedule.start_index, guard_schedule.positions, guard_schedule.loop_start)
+		context = repr((RESULT_VERSION, environment.cols, environment.chars, guard, max_steps))
+		self._context = hashlib.sha1(context).hexdigest()
+
+	def key(self, genome):
+		''' Return the cache key for a genome. '''
+
+		return self._context + genome.digest()
+
+	def get(self, key):
+		''' Return the cached result for a key, or None if there isn't one. '''
+
+		result = self._results.pop(key, None)
+		if (result is None) and (self._disk is not None):
+			result = self._disk.get(key)
+
+		if result is None:
+			self.misses += 1
+			return None
+
+		self.hits += 1
+		# (re)insert as the most recently used result
+		self._results[key] = result
+		self._evict()
+
+		return result
+
+	def put(self, key, result):
+		''' Cache the result for a key. '''
+
+		self._results.pop(key, None)
+		self._results[key] = result
+		self._evict()
+
+		if self._disk is not None:
+			self._disk[key] = result
+
+	def snapshot(self):
+		''' Return the in-memory results and statistics of the cache, to be restored with `restore`. '''
+
+		return (self._results.items(), self.hits, self.misses)
+
+	def restore(self, snapshot):
+		''' Replace the in-memory results and statistics of the cache with those from `snapshot`. '''
+
+		results, self.hits, self.misses = snapshot
+		# changed in place, as other caches may share it
+		self._results.clear()
+		self._results.update(results)
+		self._evict()
+
+	def close(self):
+		''' Write out and close the on-disk cache, if there is one. '''
+
+		if (self._disk is not None) and self._owns_disk:
+			self._disk.close()
+		self._disk = None
+
+	def _evict(self):
+		''' Forget the least recently used results until the cache is within its capacity. '''
+
+		while len(self._results) > self.capacity:
+			self._results.popitem(last=False)
@@ -1,100 +1,326 @@
-import pyglet
-
-from random import randint, random, choice
+from random import randint, random, choice, getstate, setstate
+from multiprocessing import Pool
 import os
 import pickle
-from pickle import PicklingError
 
+import codec
 import util
-from agent import Agent, Guard
-from sim_window import SimWindow
-from program_tree import ProgramTree
+from agent import Agent, Guard, GuardSchedule
+from simulator import Simulator
+from fitness_cache import FitnessCache
+from results import ResultsLogger, append_summary, truncate_summary
+from genome import Genome
+from simplify import simplify
+from selection import STRATEGIES, RouletteSelection, TournamentSelection
+from profiling import Profiler, NullProfiler, truncate_profile
+
+# name of the checkpoint file in an experiment's log folder, and the version of its format
+CHECKPOINT_FILE = 'checkpoint.pk'
+CHECKPOINT_VERSION = 2
+
+# ways of combining an agent's distances from the goal on each map
+AGGREGATES = ('mean', 'worst')
 
 class Experiment():
-	def __init__(self, log_folder, map_file, population_size, max_steps, guard_move=0, iterations=5, reproduction_prob=0.14, crossover_prob=0.85, mutation_prob=0.01):
+	# number of times a genetic operation is tried before falling back to copying the parent
+	MAX_ATTEMPTS = 5
+
+	def __init__(self, log_folder, map_file, population_size, max_steps, guard_move=0, iterations=5, reproduction_prob=0.14, crossover_prob=0.85, mutation_prob=0.01, workers=1, chunk_size=None, vectorized=False, cache_size=0, cache_file=None, simplify=False, selection='roulette', tournament_size=2, max_nodes=0, max_depth=0, parsimony=0.0, checkpoint_interval=0, guard_program=None, aggregate='mean', early_stopping=False, map_cache=None, profile=False, profile_iteration=None):
 		''' Set up a new experiement.
 
 		args
 		----
 			log_folder: The folder in which to store logs of the experiment.
-			map_file: The file containing the map definition to use.
+			map_file: The file containing the map definition to use, or a list of files to evaluate agents on every map of.
 			population_size: The initial population size to use.
 			max_steps: The maximum number of game loops an agent will get to reach the goal.
 				If 0, will be unlimited.
 			guard_move: Length of a guard's random walk.
 			iterations: Number of reproductive cycles to perform.
+			workers: Number of processes to evaluate the population with. If 1, agents are evaluated in this process.
+			chunk_size: Number of agents sent to a worker process at a time.
+				If None, the population is split into roughly four chunks per worker.
+			vectorized: True to evaluate the whole population at once with a BatchSimulator (needs NumPy
+				and a step limit). Takes the place of worker processes.
+			cache_size: Number of simulation results to cache in memory, so identical agents are only simulated once.
+				If 0, results are not cached.
+			cache_file: File to also cache simulation results in, to reuse them across experiments.
+			simplify: True to simplify each agent's genome (see `simplify.simplify`) before evaluating it.
+				Agents keep their original genomes, but equivalent agents share a cached result.
+			selection: How agents are selected for genetic operations (see `selection.STRATEGIES`) -
+				'roulette' (by fitness), 'rank' (by rank of fitness) or 'tournament'.
+			tournament_size: Number of agents in each tournament, for tournament selection.
+			max_nodes: Maximum number of nodes in a genome created by crossover or mutation. If 0, will be unlimited.
+			max_depth: Maximum depth of a genome created by crossover or mutation. If 0, will be unlimited.
+			parsimony: Fitness lost per node in an agent's genome, to favour smaller agents.
+			checkpoint_interval: Number of iterations between checkpoints of the whole experiment
+				(see `resume`). If 0, no checkpoints are saved.
+			guard_program: A Genome to use as the guard's movement pattern instead of a random walk.
+			aggregate: How an agent's distances from the goal on each map are combined - 'mean' or 'worst'.
+			early_stopping: True to stop evaluating an agent on further maps once its combined distance
+				can't be as good as the best of the previous iteration. Its distance is then combined
+				from the maps it was evaluated on.
+			map_cache: Folder to keep compiled maps in, so maps are only parsed once across worker
+				processes and experiments (see `util.create_map`). If None, maps are always parsed.
+			profile: True to record the time spent in each phase of every generation, and counters of
+				simulation steps run, steps looked up in the fitness caches, conditionals evaluated, nodes copied
+				and cache hits (see `profiling.Profiler`).
+				Records are kept in `profiler.generations` and appended to 'profile.jsonl' in the log folder.
+			profile_iteration: Iteration number to run cProfile for (turning on `profile`), writing its
+				statistics to 'profile_<iteration>.prof' in the log folder. If None, cProfile isn't used.
 
 		'''
 
+		# arguments the experiment was created with, saved in checkpoints
+		self.settings = dict(locals())
+		del self.settings['self']
+
 		# check probabilities given sum to 1
 		if not ((reproduction_prob + crossover_prob + mutation_prob) == 1.0):
 			print '!!! Bad genetic operation probabilities. Check parameters. !!!'
 			return
 
 		self.log_folder = log_folder
-		self.environment = util.create_map(map_file)
+		self.map_files = [map_file] if isinstance(map_file, basestring) else list(map_file)
+		self.map_file = self.map_files[0]
+		self.map_cache = map_cache
+		self.environments = [util.create_map(file_name, map_cache) for file_name in self.map_files]
+		self.environment = self.environments[0]
 		self.population_size = population_size
 		self.max_steps = max_steps
 		self.iterations = iterations
 		self.reproduction_prob = reproduction_prob
 		self.crossover_prob = crossover_prob
 		self.mutation_prob = mutation_prob
+		self.workers = workers
+		self.chunk_size = chunk_size
+		self.vectorized = vectorized
+		self.simplify = simplify
+		if selection not in STRATEGIES:
+			raise ValueError('Unknown selection strategy: ' + str(selection))
+		self.selection = selection
+		self.tournament_size = tournament_size
+		self.max_nodes = max_nodes
+		self.max_depth = max_depth
+		self.parsimony = parsimony
+		self.checkpoint_interval = checkpoint_interval
+		self.cache_size = cache_size
+		self.cache_file = cache_file
+		if aggregate not in AGGREGATES:
+			raise ValueError('Unknown aggregate: ' + str(aggregate))
+		self.aggregate = aggregate
+		self.early_stopping = early_stopping
+		if profile or (profile_iteration is not None):
+			self.profiler = Profiler(log_folder, profile_iteration)
+		else:
+			self.profiler = NullProfiler()
+		# closest combined distance from the goal in the last iteration
+		self.best_distance = None
+		# iteration to start running from - after the last checkpoint for a resumed experiment
+		self.start_iteration = 0
 		# initialise agents
 		self.population = self._init_population(self.environment, self.population_size)
-		self.guard = None
-		if self.environment.guard_start:
-			self.guard = Guard(self.environment, self.environment.guard_start, move=guard_move)
+		# guard (and its movement) in each map, or None for maps without one
+		self.guards = []
+		self.guard_schedules = []
+		for environment in self.environments:
+			guard = None
+			if environment.guard_start:
+				guard = Guard(environment, environment.guard_start, move=guard_move, program_tree=guard_program)
+			self.guards.append(guard)
+			self.guard_schedules.append(GuardSchedule(guard) if guard else None)
+		self._init_evaluation()
+
+	@classmethod
+	def resume(cls, log_folder, iterations=None):
+		''' Recreate an experiment from the last checkpoint saved in its log folder.
+
+		Running the experiment continues from the iteration after the checkpoint, exactly as
+		the original experiment would have.
+
+		args
+		----
+			log_folder: The log folder of the experiment (which may have been moved).
+			iterations: Number of reproductive cycles to perform in total, to extend (or shorten) the experiment.
+				If None, the experiment's own number is used.
+
+		return
+		------
+			The experiment.
+
+		'''
+
+		with open(log_folder + CHECKPOINT_FILE, 'rb') as in_file:
+			state = pickle.load(in_file)
+
+		if state['version'] != CHECKPOINT_VERSION:
+			raise ValueError('Unsupported checkpoint version: ' + str(state['version']))
+
+		settings = dict(state['settings'])
+		settings['log_folder'] = log_folder
+		if iterations is not None:
+			settings['iterations'] = iterations
+		experiment = cls(**settings)
+
+		experiment.population = [Agent(experiment.environment, experiment.environment.agent_start, genome) for genome in state['population']]
+		experiment.guards = []
+		for environment, guard_genome in zip(experiment.environments, state['guards']):
+			guard = None
+			if guard_genome is not None:
+				guard = Guard(environment, environment.guard_start, program_tree=guard_genome)
+			experiment.guards.append(guard)
+		experiment.guard_schedules = state['guard_schedules']
+		experiment._close_caches()
+		experiment._init_evaluation()
+		if experiment.fitness_caches and state['fitness_cache']:
+			experiment.fitness_caches[0].restore(state['fitness_cache'])
+			for cache, (hits, misses) in zip(experiment.fitness_caches, state['cache_counts']):
+				cache.hits, cache.misses = hits, misses
+
+		experiment.best_distance = state['best_distance']
+		experiment.start_iteration = state['iteration']
+		# forget summaries and profiles of iterations run after the checkpoint
+		truncate_summary(log_folder, experiment.start_iteration)
+		truncate_profile(log_folder, experiment.start_iteration)
+		setstate(state['random_state'])
+
+		return experiment
+
+	@property
+	def guard(self):
+		''' The guard in the first map, or None. '''
+
+		return self.guards[0]
+
+	@property
+	def guard_schedule(self):
+		''' The movement of the guard in the first map, or None. '''
+
+		return self.guard_schedules[0]
+
+	def _init_evaluation(self):
+		''' Set up the batch simulator and fitness cache (if used) for each map and its guard.
+
+		The fitness caches of all the maps share their storage.
+
+		'''
+
+		self.batch_simulators = []
+		if self.vectorized:
+			from batch_simulator import BatchSimulator
+			for environment, guard_schedule in zip(self.environments, self.guard_schedules):
+				self.batch_simulators.append(BatchSimulator(environment, guard_schedule, self.max_steps))
+		self.fitness_caches = []
+		if (self.cache_size > 0) or self.cache_file:
+			for environment, guard_schedule in zip(self.environments, self.guard_schedules):
+				shared_with = self.fitness_caches[0] if self.fitness_caches else None
+				self.fitness_caches.append(FitnessCache(environment, guard_schedule, self.max_steps, max(self.cache_size, 1), self.cache_file, shared_with))
+
+	def _close_caches(self):
+		''' Close the fitness caches, writing out any on-disk cache. '''
+
+		# the first cache owns the shared storage, so is closed last
+		for cache in reversed(self.fitness_caches):
+			cache.close()
 
 	def run(self):
 		''' Run the experiment. '''
 
-		for iteration in range(self.iterations):
-			# calculate
-			results = self._run_iteration(iteration)
-			best = min(results, key=lambda p: p[1])[1]
-			print 'Closest distance:', best
-			# save all perfect-performing agent trees
-			best_agents = [result[0] for result in results if result[1] == best]
-			for i in range(len(best_agents)):
-				self._pickle_best(best_agents[i], i, iteration + 1)
-			print 'Best program tree saved.'
-			# apply genetics
-			if iteration < (self.iterations - 1):
-				self._generate_new_population(results)
-				print 'New population generated.'
-
-	def _pickle_best(self, agent, num, iteration):
-		''' Save the program tree of an agent instance to file.
+		pool = None
+		if (self.workers > 1) and not self.vectorized:
+			pool = Pool(self.workers, _init_worker, (self.map_files, self.guard_schedules, self.max_steps, self.map_cache))
+
+		try:
+			self._run(pool)
+		finally:
+			if pool:
+				pool.close()
+				pool.join()
+			self._close_caches()
+
+	def _run(self, pool):
+		''' Run each iteration of the experiment, evaluating agents in `pool` if given. '''
+
+		profiler = self.profiler
+		for iteration in range(self.start_iteration, self.iterations):
+			with profiler.generation(iteration + 1):
+				# calculate
+				results = self._run_iteration(iteration, pool)
+				best = min(results, key=lambda p: p[1])[1]
+				self.best_distance = best
+				print 'Closest distance:', best
+				# save all perfect-performing agent trees
+				with profiler.phase('saving'):
+					best_agents = [result[0] for result in results if result[1] == best]
+					for i in range(len(best_agents)):
+						self._save_best(best_agents[i], i, iteration + 1)
+				print 'Best program tree saved.'
+				# apply genetics
+				if iteration < (self.iterations - 1):
+					self._generate_new_population(results)
+					print 'New population generated.'
+					if self.checkpoint_interval and ((iteration + 1) % self.checkpoint_interval == 0):
+						with profiler.phase('checkpoint'):
+							self._checkpoint(iteration + 1)
+						print 'Checkpoint saved.'
+
+	def _checkpoint(self, iteration):
+		''' Save everything needed to resume the experiment from the start of an iteration.
+
+		The checkpoint is written atomically, so a crash while saving leaves the previous one intact.
+
+		args
+		----
+			iteration: The iteration the experiment will resume from.
+
+		'''
+
+		state = {
+			'version': CHECKPOINT_VERSION,
+			'settings': self.settings,
+			'iteration': iteration,
+			'population': [agent.genome for agent in self.population],
+			'guards': [guard.genome if guard else None for guard in self.guards],
+			'guard_schedules': self.guard_schedules,
+			# the caches share their results, so only the first cache's are saved
+			'fitness_cache': self.fitness_caches[0].snapshot() if self.fitness_caches else None,
+			'cache_counts': [(cache.hits, cache.misses) for cache in self.fitness_caches],
+			'best_distance': self.best_distance,
+			'random_state': getstate()
+		}
+
+		if not os.path.exists(self.log_folder):
+			os.makedirs(self.log_folder)
+		util.write_atomically(self.log_folder + CHECKPOINT_FILE, pickle.dumps(state, pickle.HIGHEST_PROTOCOL))
+
+	def _save_best(self, agent, num, iteration):
+		''' Save the genome of an agent instance to file (see `codec`).
 		Generally used on the best agent from an iteration.
 
-		Will save in the experiment log folder as 'best-<iteration>.pk'
+		Will save in the experiment log folder as 'best_<iteration>-<num>.gpt'
 
 		args
 		----
-			agent: The agent who's program tree is to be be saved.
+			agent: The agent who's genome is to be be saved.
 			num: The agent number (i.e., if there are more than one 'best' agent).
 			iteration: The population iteration the agent was from.
 
 		'''
 
-		try:
-			file_name = self.log_folder + 'best_' + str(iteration) + '-' + str(num) + '.pk'
-			with open(file_name, 'wb') as output:
-				pickle.dump(agent.program_tree, output, pickle.HIGHEST_PROTOCOL)
-		except PicklingError:
-			print 'Pickle failed.'
-			output.close()
-			return
+		file_name = self.log_folder + 'best_' + str(iteration) + '-' + str(num) + '.gpt'
+		codec.dump(agent.genome, file_name)
 
-	def _run_iteration(self, iteration):
+	def _run_iteration(self, iteration, pool=None):
 		''' Run a single iteration, logging the results.
 
-		All agents are reset to their starting position and top of their program
-		tree after.
+		Every agent is run from its starting position and the top of its program tree,
+		against the guard's precomputed movement, so results don't depend on the order
+		(or process) agents are evaluated in.
 
 		args
 		----
 			iteration: The iteration number.
+			pool: A worker pool (see `_init_worker`) to evaluate agents in. If None, agents are evaluated in this process.
 
 		return
 		------
@@ -103,24 +329,196 @@ class Experiment():
 		'''
 
 		print 'Iteration:', iteration + 1
-		logger = Logger(self.log_folder, iteration + 1, len(self.population))
+		profiler = self.profiler
+		logger = ResultsLogger(self.log_folder, iteration + 1)
+
+		genomes = [agent.genome for agent in self.population]
+		if self.simplify:
+			with profiler.phase('simplify'):
+				genomes = [simplify(genome) for genome in genomes]
+		hits = sum(cache.hits for cache in self.fitness_caches)
+		misses = sum(cache.misses for cache in self.fitness_caches)
+		with profiler.phase('evaluation'):
+			outcomes = self._evaluate_population(genomes, pool)
+		if self.fitness_caches:
+			profiler.count('cache_hits', sum(cache.hits for cache in self.fitness_caches) - hits)
+			profiler.count('cache_misses', sum(cache.misses for cache in self.fitness_caches) - misses)
+			print 'Fitness cache hits:', sum(cache.hits for cache in self.fitness_caches), 'misses:', sum(cache.misses for cache in self.fitness_caches)
+
+		with profiler.phase('logging'):
+			distances = [] # list of (agent, distance_from_goal) pairs
+			for agent, (outcome, distance_from_goal, steps) in zip(self.population, outcomes):
+				logger.log_performance(outcome, distance_from_goal, steps, len(agent.genome))
+				distances.append([agent, distance_from_goal])
+
+			logger.close()
+			append_summary(self.log_folder, logger.summary())
+
+		return distances
 
-		distances = [] # list of (agent, distance_from_goal) pairs
-		agent_num = 0
-		for agent in self.population:
-			agent_num += 1
-# 			print 'Running agent', str(agent_num)
-			sim = SimWindow(agent, self.guard, self.environment, self.max_steps, graphics_on=False)
-			pyglet.app.run()
-			distance_from_goal = agent.tile.distance(self.environment.goal)
-			logger.log_performance(agent, distance_from_goal)
-			distances.append([agent, distance_from_goal])
+	def _evaluate_population(self, genomes, pool):
+		''' Simulate an agent for each genome on every map, combining the results of the maps.
 
-			agent.reset()
+		With early stopping, the population is evaluated one map at a time, dropping agents which
+		can't match the best combined distance of the last iteration. Otherwise every map is
+		evaluated at once.
 
-		logger.close()
+		return
+		------
+			A list of (outcome, distance_from_goal, steps) tuples, one per genome (see `_combine`).
 
-		return distances
+		'''
+
+		num_maps = len(self.environments)
+		map_results = [[] for genome in genomes]
+
+		if self.early_stopping and (self.best_distance is not None):
+			remaining = range(len(genomes))
+			for map_index in range(num_maps):
+				results = self._evaluate_on_maps([(map_index, genomes[i]) for i in remaining], pool)
+				for i, result in zip(remaining, results):
+					map_results[i].append(result)
+				remaining = [i for i in remaining if self._distance_bound(map_results[i]) <= self.best_distance]
+		else:
+			pairs = [(map_index, genome) for genome in genomes for map_index in range(num_maps)]
+			results = self._evaluate_on_maps(pairs, pool)
+			for i in range(len(genomes)):
+				map_results[i] = results[i * num_maps:(i + 1) * num_maps]
+
+		return [self._combine(results) for results in map_results]
+
+	def _combine(self, results):
+		''' Combine an agent's results on the first maps (all maps, unless evaluation stopped early).
+
+		Distances are combined with the experiment's aggregate, over the maps the agent was evaluated on
+		(which is more than the best distance, for an agent stopped early). The agent is caught if it was caught on any map, and reached
+		the goal only if it did on every map. Otherwise its outcome is its first other outcome, or
+		the step limit if it wasn't evaluated on every map. Steps are added up.
+
+		args
+		----
+			results: The agent's (outcome, distance_from_goal, steps) results on each map it was evaluated on.
+
+		return
+		------
+			The combined (outcome, distance_from_goal, steps) result.
+
+		'''
+
+		num_maps = len(self.environments)
+		if (num_maps == 1) and (len(results) == 1):
+			return results[0]
+
+		outcomes = [outcome for outcome, distance, steps in results]
+		if Simulator.CAUGHT in outcomes:
+			outcome = Simulator.CAUGHT
+		elif len(results) < num_maps:
+			outcome = Simulator.STEP_LIMIT
+		else:
+			outcome = ([outcome for outcome in outcomes if outcome != Simulator.GOAL] or [Simulator.GOAL])[0]
+
+		distances = [distance for outcome, distance, steps in results]
+		if self.aggregate == 'worst':
+			distance = max(distances)
+		else:
+			distance = float(sum(distances)) / len(distances)
+
+		return outcome, distance, sum(steps for outcome, distance, steps in results)
+
+	def _distance_bound(self, results):
+		''' Return the closest combined distance an agent could get, given its results on the first maps. '''
+
+		distances = [distance for outcome, distance, steps in results]
+		if self.aggregate == 'worst':
+			return max(distances)
+
+		# the agent could reach the goal on every other map
+		return float(sum(distances)) / len(self.environments)
+
+	def _evaluate_on_maps(self, pairs, pool):
+		''' Simulate agents on maps, looking results up in the fitness caches where possible.
+
+		args
+		----
+			pairs: A list of (map index, genome) pairs.
+			pool: A worker pool to evaluate agents in, or None.
+
+		return
+		------
+			A list of (outcome, distance_from_goal, steps) tuples, one per pair.
+
+		'''
+
+		if not self.fitness_caches:
+			return self._simulate_population(pairs, pool)
+
+		keys = [self.fitness_caches[map_index].key(genome) for map_index, genome in pairs]
+		results = [self.fitness_caches[map_index].get(key) for key, (map_index, genome) in zip(keys, pairs)]
+
+		# simulate each distinct genome missing from the cache once
+		missing = {}
+		for key, pair, result in zip(keys, pairs, results):
+			if result is None:
+				missing[key] = pair
+		missing_keys = sorted(missing)
+		simulated = dict(zip(missing_keys, self._simulate_population([missing[key] for key in missing_keys], pool)))
+		for key in missing_keys:
+			self.fitness_caches[missing[key][0]].put(key, simulated[key])
+
+		results = [result if result is not None else simulated[key] for key, result in zip(keys, results)]
+		# steps of the results which weren't simulated - cache hits, and repeats of a genome simulated once
+		self.profiler.count('cached_steps', sum(steps for outcome, distance_from_goal, steps in results) - sum(steps for outcome, distance_from_goal, steps in simulated.values()))
+
+		return results
+
+	def _simulate_population(self, pairs, pool):
+		''' Simulate agents on maps, counting the steps run in the 'steps' counter of the profiler.
+
+		args
+		----
+			pairs: A list of (map index, genome) pairs.
+			pool: A worker pool to evaluate agents in, or None.
+
+		return
+		------
+			A list of (outcome, distance_from_goal, steps) tuples, one per pair.
+
+		'''
+
+		if len(pairs) == 0:
+			return []
+
+		if self.batch_simulators:
+			# each map's agents are simulated together
+			results = [None] * len(pairs)
+			steps_run = sum(batch_simulator.steps_run for batch_simulator in self.batch_simulators)
+			for map_index, batch_simulator in enumerate(self.batch_simulators):
+				indices = [i for i, pair in enumerate(pairs) if pair[0] == map_index]
+				if indices:
+					for i, result in zip(indices, batch_simulator.evaluate([pairs[i][1] for i in indices])):
+						results[i] = result
+			self.profiler.count('steps', sum(batch_simulator.steps_run for batch_simulator in self.batch_simulators) - steps_run)
+			return results
+
+		if pool:
+			simulations = pool.map(_evaluate, pairs, self._chunk_size())
+		else:
+			simulations = []
+			for map_index, genome in pairs:
+				environment = self.environments[map_index]
+				agent = Agent(environment, environment.agent_start, genome)
+				simulations.append(_simulate(agent, self.guard_schedules[map_index], environment, self.max_steps))
+
+		self.profiler.count('steps', sum(steps_run for result, steps_run in simulations))
+		return [result for result, steps_run in simulations]
+
+	def _chunk_size(self):
+		''' Number of agents to send to a worker process at a time. '''
+
+		if self.chunk_size:
+			return self.chunk_size
+
+		return max(1, len(self.population) * len(self.environments) // (self.workers * 4))
 
 	def _generate_new_population(self, iteration_results):
 		''' Choose reproduction, crossover or mutation randomly (according to their weight)
@@ -148,80 +546,127 @@ class Experiment():
 		'''
 
 		new_population = []
+		profiler = self.profiler
 
-		# change distances to fitness values (fitness = max_steps - distance) - lower distances = higher fitness
-		fitness_values = [[agent, (self.max_steps - distance_from_goal)] for agent, distance_from_goal in iteration_results]
+		with profiler.phase('selection'):
+			# change distances to fitness values (fitness = max_steps - distance) - lower distances = higher fitness
+			fitness_values = [[agent, (self.max_steps - distance_from_goal)] for agent, distance_from_goal in iteration_results]
+			if self.parsimony:
+				# larger agents are less fit (but fitness is never negative)
+				fitness_values = [[agent, max(fitness - self.parsimony * len(agent.genome), 0)] for agent, fitness in fitness_values]
+			selector = self._selector(fitness_values)
 
 		# apply genetic operations until a new population has been created
-		while len(new_population) < self.population_size:
-			genetic_operation = self._random_genetic_operation()
-			if genetic_operation is 'reproduction':
-				self._reproduction(fitness_values, new_population)
-			elif genetic_operation is 'crossover':
-				self._crossover(fitness_values, new_population)
-			elif genetic_operation is 'mutation':
-				self._mutation(fitness_values, new_population)
+		with profiler.phase('genetic_operations'):
+			while len(new_population) < self.population_size:
+				genetic_operation = self._random_genetic_operation()
+				if genetic_operation is 'reproduction':
+					self._reproduction(selector, new_population)
+				elif genetic_operation is 'crossover':
+					self._crossover(selector, new_population)
+				elif genetic_operation is 'mutation':
+					self._mutation(selector, new_population)
 
 		self.population = new_population
 
-	def _reproduction(self, fitness_values, new_population):
+	def _selector(self, fitness_values):
+		''' Create the selection strategy for a generation.
+
+		args
+		----
+			fitness_values: A list of [agent, fitness] pairs.
+
+		return
+		------
+			An object whose `select()` method returns a randomly selected agent.
+
+		'''
+
+		if self.selection == 'tournament':
+			return TournamentSelection(fitness_values, self.tournament_size)
+
+		return STRATEGIES[self.selection](fitness_values)
+
+	def _reproduction(self, selector, new_population):
 		''' Perform a reproduction operation. '''
 
-		selected_agent = self._random_agent_by_fitness(fitness_values)
+		selected_agent = selector.select()
 		new_population.append(selected_agent.copy())
+		self.profiler.count('nodes_copied', len(selected_agent.genome))
 
-	def _mutation(self, fitness_values, new_population):
+	def _mutation(self, selector, new_population):
 		''' Perform a mutation operation. '''
 
-		to_mutate = self._random_agent_by_fitness(fitness_values)
-		# randomly generate new subtree of random size in the range [5, 10]
-		random_subtree = util.random_program_tree(randint(5, 10)).start_node
-		# copy program tree, select random node and attach generated subtree in its place
-		new_tree = to_mutate.program_tree.copy()
-		attach_point = new_tree.random_node().parent
-
-		while attach_point is None:
-			attach_point = new_tree.random_node().parent
-
-		random_subtree.parent = attach_point
-		if attach_point.conditional:
-			true_branch = choice([True, False])
-			if true_branch:
-				attach_point.true_branch = random_subtree
+		to_mutate = selector.select()
+		for attempt in range(Experiment.MAX_ATTEMPTS):
+			# randomly generate new subtree of random size in the range [5, 10]
+			random_subtree = Genome.from_tree(util.random_program_tree(randint(5, 10)))
+			# copy genome, select random node and attach generated subtree in its place
+			new_genome = to_mutate.genome.copy()
+			self.profiler.count('nodes_copied', len(new_genome))
+			if len(new_genome) > 1:
+				attach_point = new_genome.parent(new_genome.random_node(exclude_root=True))
+				new_genome.replace_branch(attach_point, self._random_branch(new_genome, attach_point), random_subtree)
 			else:
-				attach_point.false_branch = random_subtree
+				# the root is the only node - replace it
+				new_genome = random_subtree
+
+			if self._within_limits(new_genome):
+				break
 		else:
-			attach_point.next_node = random_subtree
+			new_genome = to_mutate.genome.copy()
+			self.profiler.count('nodes_copied', len(new_genome))
 
-		new_population.append(Agent(to_mutate.game_map, to_mutate.game_map.agent_start, new_tree))
+		new_population.append(Agent(to_mutate.game_map, to_mutate.game_map.agent_start, new_genome))
 
-	def _crossover(self, fitness_values, new_population):
+	def _crossover(self, selector, new_population):
 		''' Perform a crossover operation. '''
 
-		crossover_agent = self._random_agent_by_fitness(fitness_values)
-		new_tree = crossover_agent.program_tree.copy()
-		replacement_subtree = self._random_agent_by_fitness(fitness_values).program_tree.copy()
+		crossover_agent = selector.select()
+		donor = None
+		for attempt in range(Experiment.MAX_ATTEMPTS):
+			new_genome = crossover_agent.genome.copy()
+			self.profiler.count('nodes_copied', len(new_genome))
 
-		# find crossover point in the first tree, and replacement subtree from a second parent
-		crossover_point = new_tree.random_node()
-		new_subtree = ProgramTree(self._random_agent_by_fitness(fitness_values).program_tree.random_node()).copy().start_node
+			# find crossover point in the first genome, and replacement subtree from a second parent
+			crossover_point = new_genome.random_node()
+			if donor is None:
+				donor = selector.select().genome
+			new_subtree = donor.subtree(donor.random_node())
+			self.profiler.count('nodes_copied', len(new_subtree))
 
-		# link replacement subtree at crossover point
-		new_subtree.parent = crossover_point
-		if crossover_point.conditional:
-			true_branch = choice([True, False])
-			if true_branch:
-				crossover_point.true_branch = new_subtree
-			else:
-				crossover_point.false_branch = new_subtree
+			# link replacement subtree at crossover point
+			new_genome.replace_branch(crossover_point, self._random_branch(new_genome, crossover_point), new_subtree)
+
+			if self._within_limits(new_genome):
+				break
 		else:
-			crossover_point.next_node = new_subtree
+			new_genome = crossover_agent.genome.copy()
+			self.profiler.count('nodes_copied', len(new_genome))
+
+		new_population.append(Agent(crossover_agent.game_map, crossover_agent.game_map.agent_start, new_genome))
+
+	def _within_limits(self, genome):
+		''' Check if a genome is within the experiment's size and depth limits. '''
+
+		if self.max_nodes and (len(genome) > self.max_nodes):
+			return False
 
-		new_population.append(Agent(crossover_agent.game_map, crossover_agent.game_map.agent_start, new_tree))
+		return (not self.max_depth) or (genome.depth() <= self.max_depth)
+
+	def _random_branch(self, genome, node):
+		''' Choose the branch of a node to attach a subtree to - a random branch for a conditional. '''
+
+		if genome.conditional(node):
+			return choice(['true_branch', 'false_branch'])
+
+		return 'next_node'
 
 	def _random_agent_by_fitness(self, agent_list):
 		''' Select an agent randomly, where agents with higher fitness values are more likely to be picked.
 
+		Builds the selection table for a single pick; use `_selector` to select repeatedly.
+
 		args
 		----
 			agent_list: A list of [agent, fitness] pairs.
@@ -232,16 +677,7 @@ class Experiment():
 
 		'''
 
-		fitness_sum = sum([x[1] for x in agent_list])
-		# calculate probability of being chosen for each agent
-		probabilities = [[agent, (float(fitness) / float(fitness_sum))] for agent, fitness in agent_list]
-
-		random_num = random()
-		weight_total = 0
-		for agent, probability in probabilities:
-			weight_total += probability
-			if weight_total > random_num:
-				return agent
+		return RouletteSelection(agent_list).select()
 
 	def _random_genetic_operation(self):
 		''' Choose one of 'reproduction', 'crossover' or 'mutation' randomly according to their weighting. '''
@@ -280,33 +716,42 @@ class Experiment():
 
 		return population
 
-class Logger():
-	def __init__(self, folder, iteration_num, population_size):
-		''' Create a new logger for an iteration. '''
+# state of a worker process in an experiment's pool - set up by `_init_worker`
+_worker_environments = []
+_worker_guard_schedules = []
+_worker_max_steps = 0
 
-		if not os.path.exists(folder):
-			os.makedirs(folder)
+def _init_worker(map_files, guard_schedules, max_steps, map_cache=None):
+	''' Give a worker process its own copy of the maps and guard movements. '''
 
-		self.out_file = open(folder + str(iteration_num) + '.log', 'w+')
-		self.out_file.write('Iteration: ' + str(iteration_num) + '\n')
-		self.out_file.write('Population Size: ' + str(population_size) + '\n\n')
+	global _worker_environments, _worker_guard_schedules, _worker_max_steps
 
-	def log_performance(self, agent, distance_from_goal):
-		''' Log the performance of a specific agent. '''
+	_worker_environments = [util.create_map(map_file, map_cache) for map_file in map_files]
+	_worker_guard_schedules = guard_schedules
+	_worker_max_steps = max_steps
 
-		self.out_file.write('AGENT - ')
-		if agent.tile.detection:
-			self.out_file.write('Got caught.\n')
-		elif agent.tile.is_goal:
-			self.out_file.write('Reached goal.\n')
-		else:
-			self.out_file.write('Reached step limit.\n')
+def _evaluate(pair):
+	''' Evaluate a (map index, genome) pair in a worker process, returning what `_simulate` does. '''
+
+	map_index, genome = pair
+	environment = _worker_environments[map_index]
+	agent = Agent(environment, environment.agent_start, genome)
+	return _simulate(agent, _worker_guard_schedules[map_index], environment, _worker_max_steps)
+
+def _simulate(agent, guard_schedule, environment, max_steps):
+	''' Run an agent from its starting position.
 
-		self.out_file.write('Distance From Goal: ' + str(distance_from_goal) + '\n')
-		self.out_file.write('\n')
+	return
+	------
+		The (outcome, distance_from_goal, steps) result of the simulation, and the number of steps
+		actually run (the steps of loops skipped by the Simulator aren't).
 
-	def close(self):
-		''' Close the logger. '''
+	'''
 
-		self.out_file.close()
+	agent.reset()
+	sim = Simulator(agent, guard_schedule, environment, max_steps)
+	outcome = sim.run()
+	distance_from_goal = sim.distance_from_goal()
+	agent.reset()
 
+	return (outcome, distance_from_goal, sim.steps), sim.steps - sim.skipped_steps
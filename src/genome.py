@@ -0,0 +1,202 @@
+from array import array
+from random import randrange
+import hashlib
+
+import util
+from program_tree import ProgramTree, ProgramTreeNode
+
+# opcodes - actions are numbered first, then queries (see `util.ACTIONS` and `util.QUERIES`)
+NUM_ACTIONS = len(util.ACTIONS)
+OPCODE_NAMES = util.ACTIONS + util.QUERIES
+OPCODES = dict((action, i) for i, action in enumerate(OPCODE_NAMES))
+
+class Genome(object):
+	__slots__ = ('ops', 'sizes')
+
+	def __init__(self, ops=None, sizes=None):
+		''' Create a genome - a program tree stored as flat arrays.
+
+		Nodes are stored in preorder: each node is followed by its true and false branches
+		(if it is a conditional) or by its next node (if it is an action and has one).
+		`ops[i]` is the opcode of node `i` and `sizes[i]` is the number of nodes in the
+		subtree starting at node `i`, so every subtree is a contiguous slice of the arrays.
+		Conditionals always have both branches.
+
+		args
+		----
+			ops: An array('B') of opcodes.
+			sizes: An array('I') of subtree sizes.
+
+		'''
+
+		self.ops = ops if ops is not None else array('B')
+		self.sizes = sizes if sizes is not None else array('I')
+
+	@classmethod
+	def from_tree(cls, program_tree):
+		''' Create a genome with the same structure as a ProgramTree. '''
+
+		nodes = program_tree.preorder() if program_tree else []
+		ops = array('B', [OPCODES[node.action] for node in nodes])
+		sizes = array('I', [1]) * len(nodes)
+
+		# children always come after their parent in preorder
+		for i in reversed(range(len(nodes))):
+			node = nodes[i]
+			if node.conditional:
+				if not (node.true_branch and node.false_branch):
+					raise ValueError('Conditional node is missing a branch.')
+				true_i = i + 1
+				sizes[i] += sizes[true_i] + sizes[true_i + sizes[true_i]]
+			elif node.next_node:
+				sizes[i] += sizes[i + 1]
+
+		return cls(ops, sizes)
+
+	def to_tree(self):
+		''' Create a ProgramTree with the same structure as the genome. '''
+
+		nodes = [None] * len(self.ops)
+		for i in reversed(range(len(self.ops))):
+			if self.conditional(i):
+				true_branch = nodes[self.true_branch(i)]
+				false_branch = nodes[self.false_branch(i)]
+				node = ProgramTreeNode(None, self.action(i), conditional=True, true_branch=true_branch, false_branch=false_branch)
+				true_branch.parent = node
+				false_branch.parent = node
+			else:
+				node = ProgramTreeNode(None, self.action(i))
+				if self.sizes[i] > 1:
+					node.next_node = nodes[i + 1]
+					node.next_node.parent = node
+			nodes[i] = node
+
+		return ProgramTree(nodes[0] if len(nodes) > 0 else None)
+
+	def __len__(self):
+		return len(self.ops)
+
+	def __getstate__(self):
+		return (self.ops, self.sizes)
+
+	def __setstate__(self, state):
+		self.ops, self.sizes = state
+
+	def __str__(self):
+		return str(self.to_tree())
+
+	def digest(self):
+		''' Return a hash of the genome's structure, the same for all identical genomes. '''
+
+		return hashlib.sha1(self.ops.tostring() + self.sizes.tostring()).hexdigest()
+
+	def action(self, i):
+		''' Return the action (or query) of node `i`. '''
+
+		return OPCODE_NAMES[self.ops[i]]
+
+	def conditional(self, i):
+		''' Return True if node `i` is a conditional. '''
+
+		return self.ops[i] >= NUM_ACTIONS
+
+	def true_branch(self, i):
+		''' Return the index of the true branch of conditional node `i`. '''
+
+		return i + 1
+
+	def false_branch(self, i):
+		''' Return the index of the false branch of conditional node `i`. '''
+
+		return i + 1 + self.sizes[i + 1]
+
+	def next_node(self, i):
+		''' Return the index of the next node of action node `i`, or -1 if it has none. '''
+
+		return i + 1 if self.sizes[i] > 1 else -1
+
+	def copy(self):
+		''' Create a copy of the genome. '''
+
+		return Genome(self.ops[:], self.sizes[:])
+
+	def subtree(self, i):
+		''' Create a genome from a copy of the subtree starting at node `i`. '''
+
+		end = i + self.sizes[i]
+		return Genome(self.ops[i:end], self.sizes[i:end])
+
+	def random_node(self, exclude_root=False):
+		''' Return the index of a random node - any node other than the root if `exclude_root` is True. '''
+
+		return randrange(1 if exclude_root else 0, len(self.ops))
+
+	def parent(self, i):
+		''' Return the index of the parent of node `i`, or -1 for the root. '''
+
+		path = self._path(i)
+		return path[-1] if len(path) > 0 else -1
+
+	def depth(self):
+		''' Return the number of nodes on the longest path from the root. '''
+
+		depth = 0
+		# (node, depth of node) pairs
+		stack = [(0, 1)] if len(self.ops) > 0 else []
+		while len(stack) > 0:
+			i, node_depth = stack.pop()
+			depth = max(depth, node_depth)
+			if self.conditional(i):
+				stack.append((self.true_branch(i), node_depth + 1))
+				stack.append((self.false_branch(i), node_depth + 1))
+			elif self.sizes[i] > 1:
+				stack.append((i + 1, node_depth + 1))
+
+		return depth
+
+	def replace_branch(self, i, branch, subtree):
+		''' Replace a branch of node `i` (and everything below it) with a subtree.
+
+		args
+		----
+			i: Index of the node to attach the subtree to.
+			branch: 'true_branch' or 'false_branch' if node `i` is a conditional, otherwise 'next_node'.
+			subtree: The Genome to attach. It is copied into this genome.
+
+		'''
+
+		if branch == 'true_branch':
+			start = self.true_branch(i)
+		elif branch == 'false_branch':
+			start = self.false_branch(i)
+		else:
+			start = i + 1
+
+		# an action without a next node has an empty slot to fill
+		old_size = 0 if (branch == 'next_node' and self.sizes[i] == 1) else self.sizes[start]
+		self._splice(start, old_size, subtree, self._path(start) if old_size else self._path(i) + [i])
+
+	def _path(self, i):
+		''' Return the indices of the ancestors of node `i`, starting from the root. '''
+
+		path = []
+		node = 0
+		while node != i:
+			path.append(node)
+			if self.conditional(node):
+				false_i = self.false_branch(node)
+				node = node + 1 if i < false_i else false_i
+			else:
+				node += 1
+
+		return path
+
+	def _splice(self, start, old_size, subtree, ancestors):
+		''' Replace `old_size` nodes from `start` with a subtree, updating the sizes of its ancestors. '''
+
+		self.ops[start:start + old_size] = subtree.ops
+		self.sizes[start:start + old_size] = subtree.sizes
+
+		delta = len(subtree) - old_size
+		for ancestor in ancestors:
+			self.sizes[ancestor] += delta
@@ -0,0 +1,235 @@
+from multiprocessing import Event, Process, Queue
+from Queue import Empty
+from random import Random
+import random
+import time
+
+import util
+from agent import Agent
+from genetics import Experiment
+from genome import Genome
+
+# ways islands can be connected for migration
+TOPOLOGIES = ('ring', 'random')
+# seconds between checks on the other islands while waiting for them
+POLL_SECONDS = 0.5
+
+class IslandExperiment():
+	def __init__(self, log_folder, map_file, num_islands, island_size, max_steps, guard_move=0, iterations=5, migration_interval=5, migrants=2, topology='ring', seed=0, **options):
+		''' Set up an experiment where several populations (islands) evolve side by side.
+
+		Each island is an Experiment running in its own process. Every `migration_interval`
+		iterations, each island sends copies of its best agents to another island, where they
+		replace the worst agents before the next population is generated. Islands exchange
+		migrants through queues, and every random choice is derived from `seed`, so a run
+		can be repeated exactly.
+
+		args
+		----
+			log_folder: The folder in which to store logs of the experiment. Each island logs to
+				'island_<number>/' inside it.
+			map_file: The file containing the map definition to use.
+			num_islands: Number of islands.
+			island_size: Population size of each island.
+			max_steps: The maximum number of game loops an agent will get to reach the goal.
+				If 0, will be unlimited.
+			guard_move: Length of a guard's random walk. All islands use the same walk.
+			iterations: Number of reproductive cycles to perform.
+			migration_interval: Number of iterations between migrations. If 0, islands evolve independently.
+			migrants: Number of agents each island sends in a migration.
+			topology: 'ring' to send migrants to the next island, or 'random' to send them around
+				a ring in a new random order for each migration.
+			seed: Seed for all random choices of the experiment.
+			options: Other arguments for each island's Experiment (see `Experiment`).
+
+		'''
+
+		if topology not in TOPOLOGIES:
+			raise ValueError('Unknown topology: ' + str(topology))
+		if options.get('checkpoint_interval'):
+			raise ValueError('Island experiments can\'t be checkpointed.')
+
+		self.log_folder = log_folder
+		self.map_file = map_file
+		self.num_islands = num_islands
+		self.island_size = island_size
+		self.max_steps = max_steps
+		self.guard_move = guard_move
+		self.iterations = iterations
+		self.migration_interval = migration_interval
+		self.migrants = migrants
+		self.topology = topology
+		self.seed = seed
+		self.options = options
+
+	def run(self):
+		''' Run the experiment, returning once every island has finished. '''
+
+		seeds = Random(self.seed)
+		island_seeds = [seeds.getrandbits(64) for i in range(self.num_islands)]
+		topology_seed = seeds.getrandbits(64)
+
+		# every island must use the same guard movement
+		guard_program = None
+		if self.guard_move > 0:
+			state = random.getstate()
+			random.seed(seeds.getrandbits(64))
+			guard_program = Genome.from_tree(util.random_guard_movement(self.guard_move))
+			random.setstate(state)
+
+		inboxes = [Queue() for i in range(self.num_islands)]
+		# set by each island when it stops, however it stops
+		stopped = [Event() for i in range(self.num_islands)]
+		processes = []
+		for index in range(self.num_islands):
+			island_settings = {
+				'index': index,
+				'inboxes': inboxes,
+				'stopped': stopped,
+				'migration_interval': self.migration_interval,
+				'migrants': self.migrants,
+				'topology': self.topology,
+				'topology_seed': topology_seed
+			}
+			experiment_settings = dict(self.options)
+			experiment_settings.update({
+				'log_folder': self.log_folder + 'island_' + str(index) + '/',
+				'map_file': self.map_file,
+				'population_size': self.island_size,
+				'max_steps': self.max_steps,
+				'guard_move': self.guard_move,
+				'guard_program': guard_program,
+				'iterations': self.iterations
+			})
+			process = Process(target=_run_island, args=(island_seeds[index], island_settings, experiment_settings))
+			process.start()
+			processes.append(process)
+
+		# stop every island as soon as one fails, rather than leaving the others waiting for it
+		terminated = []
+		while any(process.exitcode is None for process in processes):
+			if any(process.exitcode for process in processes):
+				for index, process in enumerate(processes):
+					if process.exitcode is None:
+						process.terminate()
+						terminated.append(index)
+				break
+			time.sleep(POLL_SECONDS)
+
+		for process in processes:
+			process.join()
+
+		failed = [index for index, process in enumerate(processes) if process.exitcode != 0 and index not in terminated]
+		if failed:
+			raise RuntimeError('Islands failed: ' + ', '.join(str(index) for index in failed))
+
+# ------------------------------------------------------------------------------- #
+
+class Island(Experiment):
+	def __init__(self, index, inboxes, stopped, migration_interval, migrants, topology, topology_seed, **experiment_settings):
+		''' Create one island of an IslandExperiment.
+
+		args
+		----
+			index: The island's number.
+			inboxes: The migration queue of every island, by number.
+			stopped: An Event for every island, by number, set once the island has stopped.
+			migration_interval: Number of iterations between migrations. If 0, the island never migrates.
+			migrants: Number of agents to send in a migration.
+			topology: 'ring' or 'random' (see `IslandExperiment`).
+			topology_seed: Seed used to shuffle the ring for 'random' migrations, the same for every island.
+			experiment_settings: Arguments for the island's Experiment.
+
+		'''
+
+		Experiment.__init__(self, **experiment_settings)
+		self.index = index
+		self.inboxes = inboxes
+		self.stopped = stopped
+		self.migration_interval = migration_interval
+		self.migrants = migrants
+		self.topology = topology
+		self.topology_seed = topology_seed
+		# number of populations generated so far
+		self.generation = 0
+		# migrants that arrived before the island was ready for them, by migration number
+		self._arrived = {}
+
+	def _generate_new_population(self, iteration_results):
+		''' Exchange migrants with the other islands when due, then generate the new population. '''
+
+		self.generation += 1
+		if self.migration_interval and (self.generation % self.migration_interval == 0):
+			iteration_results = self._migrate(self.generation // self.migration_interval, iteration_results)
+
+		Experiment._generate_new_population(self, iteration_results)
+
+	def destination(self, migration):
+		''' Return the number of the island to send migrants to in a migration. '''
+
+		return self._neighbour(migration, 1)
+
+	def source(self, migration):
+		''' Return the number of the island migrants are received from in a migration. '''
+
+		return self._neighbour(migration, -1)
+
+	def _neighbour(self, migration, offset):
+		''' Return the number of the island `offset` places after this one around the ring of a migration. '''
+
+		num_islands = len(self.inboxes)
+		if self.topology == 'ring':
+			return (self.index + offset) % num_islands
+
+		order = range(num_islands)
+		Random(self.topology_seed + migration).shuffle(order)
+		position = order.index(self.index)
+		return order[(position + offset) % num_islands]
+
+	def _migrate(self, migration, iteration_results):
+		''' Send copies of the best agents to another island, and replace the worst agents with the migrants received.
+
+		args
+		----
+			migration: The migration number (1 for the first migration).
+			iteration_results: Results from the last iteration, as a list of [agent, distance_from_goal] pairs.
+
+		return
+		------
+			The results with the worst agents replaced by the migrants (and their distances from the goal).
+
+		'''
+
+		# best first (keeping the original order of equally good agents)
+		ranked = sorted(iteration_results, key=lambda result: result[1])
+		emigrants = [(agent.genome, distance) for agent, distance in ranked[:self.migrants]]
+		self.inboxes[self.destination(migration)].put((migration, emigrants))
+
+		# wait for this migration's migrants - those for later migrations are kept until needed
+		source = self.source(migration)
+		while migration not in self._arrived:
+			# once the sending island has stopped, anything it sent arrives within a poll
+			source_stopped = self.stopped[source].is_set()
+			try:
+				arrived_migration, arrived = self.inboxes[self.index].get(timeout=POLL_SECONDS)
+			except Empty:
+				if source_stopped:
+					raise RuntimeError('Island ' + str(source) + ' stopped without sending migrants to island ' + str(self.index) + '.')
+				continue
+			self._arrived[arrived_migration] = arrived
+		immigrants = self._arrived.pop(migration)
+
+		start_tile = self.environment.agent_start
+		survivors = ranked[:max(len(ranked) - len(immigrants), 0)]
+		return survivors + [[Agent(self.environment, start_tile, genome), distance] for genome, distance in immigrants]
+
+def _run_island(seed, island_settings, experiment_settings):
+	''' Create and run an island in a new process. '''
+
+	random.seed(seed)
+	settings = dict(island_settings)
+	settings.update(experiment_settings)
+	try:
+		Island(**settings).run()
+	finally:
+		island_settings['stopped'][island_settings['index']].set()
@@ -1,8 +1,8 @@
-import pickle
-
 import pyglet
 
 from genetics import Experiment
+from islands import IslandExperiment
+import codec
 import util
 from agent import Agent, Guard
 from sim_window import SimWindow
@@ -14,12 +14,22 @@ if __name__ == '__main__':
 # 	experiment = Experiment('map5log/', map_file, 100, 25, guard_move=20, iterations=100)
 # 	experiment.run()
 
-# ----- Load and run a map with a pickled program tree. ----- #
+# ----- Run genetic programming experiment with 4 islands of 25 agents, migrating every 5 iterations. ----- #
+
+# 	map_file = 'maps/5.txt'
+# 	experiment = IslandExperiment('map5islands/', map_file, 4, 25, 25, guard_move=20, iterations=100, migration_interval=5, seed=1)
+# 	experiment.run()
+
+# ----- Resume a genetic programming experiment from its last checkpoint. ----- #
+
+# 	experiment = Experiment.resume('map5log/')
+# 	experiment.run()
+
+# ----- Load and run a map with a saved program tree. ----- #
 
 # 	map_file = 'maps/1.txt'
-# 	pickle_file = 'map5log/best_93-0.pk'
-# 	with open(pickle_file, 'rb') as in_file:
-# 		program_tree = pickle.load(in_file)
+# 	# trees saved as pickles by older experiments can be converted with `codec.convert_pickle`
+# 	program_tree = codec.load('map5log/best_93-0.gpt')
 #
 # 	print program_tree
 #
@@ -1,6 +1,14 @@
-import math
+from array import array
+import copy
+import struct
 
-class Map():
+# a compiled map is a header (magic, format version, rows, columns, agent start, guard start and goal indices)
+# followed by the tile characters and the traversable, goal and detection flags, one byte per tile each
+COMPILED_MAGIC = 'GPM'
+COMPILED_VERSION = 1
+COMPILED_HEADER = struct.Struct('<3sBIIiii')
+
+class Map(object):
 	# tile representations in map files
 	TRAVERSABLE_TILE = '.'
 	NON_TRAVERSABLE_TILE = 'x'
@@ -11,181 +19,376 @@ class Map():
 	def __init__(self, map_data):
 		''' Create a new Map object.
 
+		The map is stored as flat arrays indexed by tile number, numbering tiles
+		row by row from the top left of the map, using four bytes per tile. `MapTile`
+		objects are only created (as views onto the arrays) when asked for.
+
 		args
 		----
 			map_data: A tuple of tuples, where each inner tuple is a row of the map.
 
 		'''
 
-		self.tiles = None
-		self.agent_start = None
-		self.guard_start = None
-		self.goal = None
+		self.rows = 0
+		self.cols = 0
+		# characters the tiles were created from
+		self.chars = ''
+		# per-tile flags
+		self.traversable = None
+		self.is_goal = None
+		self.detection = None
+		# tile indices - -1 if not on the map
+		self.agent_start_index = -1
+		self.guard_start_index = -1
+		self.goal_index = -1
+		self.agent_position = -1
+		self.guard_position = -1
+
+		# index -> MapTile, for the tiles asked for so far
+		self._views = {}
 
 		self._create_tiles(map_data)
 
+	@classmethod
+	def from_bytes(cls, data):
+		''' Create a map from its compiled form (see `to_bytes`).
+
+		args
+		----
+			data: The compiled map, as a string.
+
+		'''
+
+		if len(data) < COMPILED_HEADER.size:
+			raise ValueError('Truncated compiled map.')
+		magic, version, rows, cols, agent_start, guard_start, goal = COMPILED_HEADER.unpack_from(data, 0)
+		if magic != COMPILED_MAGIC:
+			raise ValueError('Not a compiled map.')
+		if version != COMPILED_VERSION:
+			raise ValueError('Unsupported compiled map version: ' + str(version))
+
+		num_tiles = rows * cols
+		if len(data) != COMPILED_HEADER.size + 4 * num_tiles:
+			raise ValueError('Compiled map is the wrong size.')
+
+		game_map = cls(())
+		game_map.rows = rows
+		game_map.cols = cols
+		start = COMPILED_HEADER.size
+		game_map.chars = data[start:start + num_tiles]
+		flags = []
+		for i in range(1, 4):
+			values = array('b')
+			values.fromstring(data[start + i * num_tiles:start + (i + 1) * num_tiles])
+			flags.append(values)
+		game_map.traversable, game_map.is_goal, game_map.detection = flags
+		game_map.agent_start_index = game_map.agent_position = agent_start
+		game_map.guard_start_index = game_map.guard_position = guard_start
+		game_map.goal_index = goal
+
+		return game_map
+
+	def to_bytes(self):
+		''' Return the compiled form of the map, as it was created (without any guard's movement). '''
+
+		# detection zones change as a guard moves - the map starts with only the guard's tile marked
+		detection = array('b', [0]) * len(self.chars)
+		if self.guard_start_index >= 0:
+			detection[self.guard_start_index] = 1
+
+		header = COMPILED_HEADER.pack(COMPILED_MAGIC, COMPILED_VERSION, self.rows, self.cols, self.agent_start_index, self.guard_start_index, self.goal_index)
+		return header + self.chars + self.traversable.tostring() + self.is_goal.tostring() + detection.tostring()
+
 	def width(self):
 		''' Return the width of the map in tiles. '''
 
-		return len(self.tiles[0])
+		return self.cols
 
 	def height(self):
 		''' Return the height of the map in tiles. '''
 
-		return len(self.tiles)
+		return self.rows
+
+	def copy(self):
+		''' Create a copy of the map.
+
+		The layout is shared with the copy; the detection zones and agent and guard positions are not.
+
+		'''
+
+		result = copy.copy(self)
+		result.detection = self.detection[:]
+		result._views = {}
+
+		return result
+
+	def distance(self, index, other_index):
+		''' Calculate the manhattan distance between two tiles, given by index. '''
+
+		row, col = divmod(index, self.cols)
+		other_row, other_col = divmod(other_index, self.cols)
+
+		return abs(col - other_col) + abs(row - other_row)
+
+	def neighbour(self, index, direction):
+		''' Return the index of the tile next to a tile in a direction (left, right, north or south),
+		or -1 if it would be off the map. '''
+
+		cols = self.cols
+		if direction == 'north':
+			return index - cols if index >= cols else -1
+		elif direction == 'south':
+			return index + cols if index < (len(self.chars) - cols) else -1
+		elif direction == 'left':
+			return index - 1 if (index % cols) > 0 else -1
+		elif direction == 'right':
+			return index + 1 if (index % cols) < (cols - 1) else -1
+
+		raise ValueError('Unknown direction: ' + str(direction))
+
+	def tile(self, index):
+		''' Return the MapTile for the tile at an index, or None if index is -1. '''
+
+		if index < 0:
+			return None
+
+		view = self._views.get(index)
+		if view is None:
+			view = self._views[index] = MapTile(self, index)
+
+		return view
+
+	@property
+	def tiles(self):
+		''' A tuple of tuples of MapTile objects, where each inner tuple is a row of the map. '''
+
+		tile = self.tile
+		cols = self.cols
+		return tuple(tuple(tile(row * cols + col) for col in range(cols)) for row in range(self.rows))
+
+	@property
+	def agent_start(self):
+		''' Starting tile for the agent. '''
+
+		return self.tile(self.agent_start_index)
+
+	@property
+	def guard_start(self):
+		''' Starting tile for the guard. '''
+
+		return self.tile(self.guard_start_index)
+
+	@property
+	def goal(self):
+		''' The goal tile. '''
+
+		return self.tile(self.goal_index)
 
 	def tiles_within(self, root, direction, max_distance):
 		''' Find and return all tiles within a distance of a given
 		root tile, in a certain direction (left, right, up or down).
 
-		Uses breadth-first search.
-
 		'''
 
-		directions = {'left':'right', 'right':'left', 'north':'south', 'south':'north'}
-		del directions[directions[direction]] # remove opposite direction
+		return [self.tile(index) for index in self.indices_within(root.index, direction, max_distance)]
 
-		directed_root = getattr(root, direction)
-		if directed_root is None:
-			return [] # nothing in the direction specified
+	def indices_within(self, root, direction, max_distance):
+		''' Find and return the indices of all tiles within a distance of a given
+		root tile index, in a certain direction (left, right, up or down).
 
-		queue = [directed_root]
-		seen = []
-		result = []
+		These are the tiles `in_view` of the root tile, found row by row from the top of the map.
 
-		while len(queue) > 0:
-			curr_tile = queue.pop(0)
-			if not curr_tile:
-				continue
+		'''
 
-			if curr_tile.distance(root) <= max_distance:
-				result.append(curr_tile)
-				# add children to queue
-				# only add if parent node was valid so that search won't explore the whole map
-				for d in directions.keys():
-					child_tile = getattr(curr_tile, d)
-					if child_tile not in seen:
-						queue.append(child_tile)
+		row, col = divmod(root, self.cols)
+		result = []
 
-			seen.append(curr_tile)
+		for r in range(max(row - max_distance, 0), min(row + max_distance + 1, self.rows)):
+			# the tiles of a row within range form a single run of columns
+			reach = max_distance - abs(r - row)
+			if direction == 'left':
+				first, last = col - reach, col - 1
+			elif direction == 'right':
+				first, last = col + 1, col + reach
+			elif direction == 'north':
+				first, last = (col - reach, col + reach) if r < row else (0, -1)
+			elif direction == 'south':
+				first, last = (col - reach, col + reach) if r > row else (0, -1)
+			else:
+				raise ValueError('Unknown direction: ' + str(direction))
+
+			row_start = r * self.cols
+			result.extend(range(row_start + max(first, 0), row_start + min(last, self.cols - 1) + 1))
 
 		return result
 
+	def in_view(self, index, target, direction, max_distance):
+		''' Check if a tile is within a distance of another tile, in a certain direction (left, right, north or south).
+
+		Only the tiles' positions matter - obstacles don't block the view.
+
+		args
+		----
+			index: Index of the tile to look from.
+			target: Index of the tile to look for. If -1, it is never in view.
+			direction: The direction to look in.
+			max_distance: The furthest (manhattan) distance that can be seen.
+
+		'''
+
+		if target < 0:
+			return False
+
+		row, col = divmod(index, self.cols)
+		target_row, target_col = divmod(target, self.cols)
+		if direction == 'left':
+			ahead = col - target_col
+		elif direction == 'right':
+			ahead = target_col - col
+		elif direction == 'north':
+			ahead = row - target_row
+		elif direction == 'south':
+			ahead = target_row - row
+		else:
+			raise ValueError('Unknown direction: ' + str(direction))
+
+		return ahead > 0 and (abs(col - target_col) + abs(row - target_row)) <= max_distance
+
 	def _create_tiles(self, map_data):
-		''' Create a linked series of MapTile objects,
-		representing the same layout as given.
+		''' Fill in the tile arrays, representing the same layout as given.
 
-		Sets the map's instance variables `tiles`, `agent_start`, `guard_start` and `goal`.
+		Sets the map's instance variables for the tile flags and the agent, guard and goal positions.
 
 		args
 		----
 			map_data: A tuple of tuples, where each inner tuple is a row of the map.
 
-		return
-		------
-			A series of linked MapTile objects.
-			Starting tile for the agent.
-
 		'''
 
-		# create tiles
-		tiles = []
+		self.rows = len(map_data)
+		self.cols = len(map_data[0]) if self.rows > 0 else 0
+
+		chars = []
 		for row_data in map_data:
-			row = []
-			for i in range(len(row_data)):
-				tile_char = row_data[i]
-				if tile_char is Map.TRAVERSABLE_TILE:
-					tile = MapTile(tile_char)
-				elif tile_char is Map.AGENT_START:
-					tile = MapTile(tile_char, has_agent=True)
-					self.agent_start = tile
-				elif tile_char is Map.GUARD:
-					tile = MapTile(tile_char, has_guard=True, detection=True)
-					self.guard_start = tile
-				elif tile_char is Map.GOAL:
-					tile = MapTile(tile_char, is_goal=True)
-					self.goal = tile
-				elif tile_char is Map.NON_TRAVERSABLE_TILE:
-					tile = MapTile(tile_char, traversable=False)
-
-				row.append(tile)
-
-			tiles.append(tuple(row))
-
-		# link tiles and set their grid positions
-		for row_num in range(len(tiles)):
-			row = tiles[row_num]
-			grid_y = len(tiles) - (tiles.index(row) + 1)
-			for tile_num in range(len(row)):
-				tile = row[tile_num]
-
-				grid_x = row.index(tile)
-				tile.position = GridPosition(grid_x, grid_y)
-
-				# link left tile
-				if not (tile_num == 0):
-					left = row[tile_num - 1]
-					left.right = tile
-					tile.left = left
-				# link right tile
-				if not (tile_num == (len(row) - 1)):
-					right = right = row[tile_num + 1]
-					right.left = tile
-					tile.right = right
-				# link north tile
-				if not (row_num == 0):
-					north = tiles[row_num - 1][tile_num]
-					north.south = tile
-					tile.north = north
-				# link south tile
-				if not (row_num == (len(tiles) - 1)):
-					south = tiles[row_num + 1][tile_num]
-					south.north = tile
-					tile.south = south
-
-		self.tiles = tuple(tiles)
+			if len(row_data) != self.cols:
+				raise ValueError('Map rows must all be the same length.')
+			chars.extend(row_data)
+
+		self.chars = ''.join(chars)
+		num_tiles = len(self.chars)
+		self.traversable = array('b', [1]) * num_tiles
+		self.is_goal = array('b', [0]) * num_tiles
+		self.detection = array('b', [0]) * num_tiles
+
+		for index in range(num_tiles):
+			tile_char = self.chars[index]
+			if tile_char == Map.TRAVERSABLE_TILE:
+				pass
+			elif tile_char == Map.AGENT_START:
+				self.agent_start_index = index
+			elif tile_char == Map.GUARD:
+				self.detection[index] = 1
+				self.guard_start_index = index
+			elif tile_char == Map.GOAL:
+				self.is_goal[index] = 1
+				self.goal_index = index
+			elif tile_char == Map.NON_TRAVERSABLE_TILE:
+				self.traversable[index] = 0
+			else:
+				raise ValueError('Unknown tile character: ' + repr(tile_char))
+
+		self.agent_position = self.agent_start_index
+		self.guard_position = self.guard_start_index
 
 # ------------------------------------------------------------------------------- #
 
-class MapTile():
-	def __init__(self, tile_char, grid_position=None, traversable=True, is_goal=False, has_agent=False, has_guard=False, detection=False):
-		''' Create a MapTile object.
+class MapTile(object):
+	__slots__ = ('game_map', 'index')
+
+	def __init__(self, game_map, index):
+		''' Create a MapTile object - a view of a single tile of a Map.
 
 		args
 		----
-			tile_char: The character representing this tile in the original map file.
-			traversable: True if the tile can be occupied.
-			is_goal: True if the tile is the goal location.
-			has_agent: True if the agent is on the tile.
-			has_guard: True if a guard is on the tile.
-			detection: True if agent will be detected on this tile.
+			game_map: The Map the tile belongs to.
+			index: The index of the tile in the map.
 
 		'''
 
-		self.char = tile_char
-		self.position = grid_position
-		self.traversable = traversable
-		self.is_goal = is_goal
-		self.has_agent = has_agent
-		self.has_guard = has_guard
-		self.detection = detection
-		# neighbouring tiles
-		self.north = None
-		self.south = None
-		self.left = None
-		self.right = None
+		self.game_map = game_map
+		self.index = index
+
+	@property
+	def char(self):
+		''' The character representing this tile in the original map file. '''
+
+		return self.game_map.chars[self.index]
+
+	@property
+	def position(self):
+		''' Grid position of the tile - (0, 0) is the bottom left of the map. '''
+
+		row, col = divmod(self.index, self.game_map.cols)
+		return GridPosition(col, self.game_map.rows - (row + 1))
+
+	@property
+	def traversable(self):
+		''' True if the tile can be occupied. '''
+
+		return bool(self.game_map.traversable[self.index])
+
+	@property
+	def is_goal(self):
+		''' True if the tile is the goal location. '''
+
+		return bool(self.game_map.is_goal[self.index])
+
+	@property
+	def has_agent(self):
+		''' True if the agent is on the tile. '''
+
+		return self.game_map.agent_position == self.index
+
+	@property
+	def has_guard(self):
+		''' True if a guard is on the tile. '''
+
+		return self.game_map.guard_position == self.index
+
+	def _get_detection(self):
+		return bool(self.game_map.detection[self.index])
+
+	def _set_detection(self, detection):
+		self.game_map.detection[self.index] = detection
+
+	# True if agent will be detected on this tile
+	detection = property(_get_detection, _set_detection)
+
+	# neighbouring tiles
+	@property
+	def north(self):
+		return self.game_map.tile(self.game_map.neighbour(self.index, 'north'))
+
+	@property
+	def south(self):
+		return self.game_map.tile(self.game_map.neighbour(self.index, 'south'))
+
+	@property
+	def left(self):
+		return self.game_map.tile(self.game_map.neighbour(self.index, 'left'))
+
+	@property
+	def right(self):
+		return self.game_map.tile(self.game_map.neighbour(self.index, 'right'))
 
 	def distance(self, other):
 		''' Calculate the manhattan distance from this map
 		tile to some other map tile. '''
 
-		dx = abs(self.position.x - other.position.x)
-		dy = abs(self.position.y - other.position.y)
-
-		return dx + dy
+		return self.game_map.distance(self.index, other.index)
 
 	def __str__(self):
-		return self.char + ' ' + self.position
+		return self.char + ' ' + str(self.position)
 
 # ------------------------------------------------------------------------------- #
 
@@ -198,4 +401,3 @@ class GridPosition():
 
 	def __str__(self):
 		return '(' + str(self.x) + ',' + str(self.y) + ')'
-
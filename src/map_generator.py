@@ -0,0 +1,110 @@
+from random import Random
+import sys
+
+import util
+from map import Map
+
+# comment lines at the top of generated map files, as in the shipped maps
+MAP_KEY = (
+	'# . = traversable tile',
+	'# x = non-traversable tile',
+	'# o = agent starting position',
+	'# G = goal position',
+	'# 1 = guard position'
+)
+
+# ways the guard can be placed on a generated map
+GUARD_PLACEMENTS = (None, 'random', 'path')
+
+def generate_map(rows, cols, obstacle_density=0.2, guard='random', seed=0):
+	''' Generate a random map.
+
+	The agent starts in the leftmost column and the goal is in the rightmost column, in random rows.
+	Obstacles are placed at random, then a random path from the agent to the goal is cleared of them,
+	so the goal can always be reached. The same arguments always generate the same map.
+
+	args
+	----
+		rows: Height of the map in tiles.
+		cols: Width of the map in tiles. At least 2.
+		obstacle_density: Fraction of tiles (before the path is cleared) that are obstacles.
+		guard: Where to place the guard - None for no guard, 'random' for any traversable tile,
+			'path' for a tile on the cleared path, or a (row, column) pair (rows are numbered from
+			the top of the map). Random placements keep the agent out of the guard's detection zone.
+		seed: Seed for the map's random choices.
+
+	return
+	------
+		The map as a tuple of tuples, where each inner tuple is a row of the map (see `Map`).
+
+	'''
+
+	if rows < 1 or cols < 2:
+		raise ValueError('Maps must be at least 1 tile high and 2 tiles wide.')
+	if not (0.0 <= obstacle_density <= 1.0):
+		raise ValueError('Obstacle density must be between 0 and 1.')
+	if guard not in GUARD_PLACEMENTS and not isinstance(guard, tuple):
+		raise ValueError('Unknown guard placement: ' + str(guard))
+
+	rng = Random(seed)
+	random_value = rng.random
+	tiles = [[Map.NON_TRAVERSABLE_TILE if random_value() < obstacle_density else Map.TRAVERSABLE_TILE for col in range(cols)] for row in range(rows)]
+
+	start = (rng.randrange(rows), 0)
+	goal = (rng.randrange(rows), cols - 1)
+
+	# clear a path to the goal, moving towards it one row or column at a time
+	path = [start]
+	row, col = start
+	while (row, col) != goal:
+		if (row != goal[0]) and ((col == goal[1]) or rng.random() < 0.5):
+			row += 1 if goal[0] > row else -1
+		else:
+			col += 1
+		path.append((row, col))
+	for row, col in path:
+		tiles[row][col] = Map.TRAVERSABLE_TILE
+
+	tiles[start[0]][start[1]] = Map.AGENT_START
+	tiles[goal[0]][goal[1]] = Map.GOAL
+
+	if guard is not None:
+		if isinstance(guard, tuple):
+			position = guard
+			if not (0 <= position[0] < rows and 0 <= position[1] < cols) or position in (start, goal):
+				raise ValueError('The guard must be on the map, away from the agent and goal.')
+		else:
+			if guard == 'path':
+				candidates = path[1:-1]
+			else:
+				candidates = [(row, col) for row in range(rows) for col in range(cols) if tiles[row][col] == Map.TRAVERSABLE_TILE]
+			# the guard's detection zone is the tiles around it
+			candidates = [tile for tile in candidates if max(abs(tile[0] - start[0]), abs(tile[1] - start[1])) > 1]
+			if not candidates:
+				raise ValueError('No room for a guard on the map.')
+			position = rng.choice(candidates)
+
+		tiles[position[0]][position[1]] = Map.GUARD
+
+	return tuple(tuple(row) for row in tiles)
+
+def write_map(map_data, file_name):
+	''' Write a map (as returned by `generate_map`) to a file, in the format read by `util.create_map`. '''
+
+	lines = list(MAP_KEY)
+	lines.extend(''.join(row) for row in map_data)
+	util.write_atomically(file_name, '\n'.join(lines) + '\n')
+
+if __name__ == '__main__':
+	# generate a map file: map_generator.py file_name rows cols [obstacle_density] [seed]
+	if len(sys.argv) < 4:
+		print 'usage: python map_generator.py file_name rows cols [obstacle_density] [seed]'
+		sys.exit(1)
+
+	file_name = sys.argv[1]
+	rows, cols = int(sys.argv[2]), int(sys.argv[3])
+	obstacle_density = float(sys.argv[4]) if len(sys.argv) > 4 else 0.2
+	seed = int(sys.argv[5]) if len(sys.argv) > 5 else 0
+
+	write_map(generate_map(rows, cols, obstacle_density, seed=seed), file_name)
+	print file_name, '-', rows, 'x', cols
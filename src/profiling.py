@@ -0,0 +1,204 @@
+from timeit import default_timer
+import cProfile
+import json
+import os
+
+import compiler
+import util
+
+# file in an experiment's log folder that each generation's profile is appended to
+PROFILE_FILE = 'profile.jsonl'
+
+class Profiler():
+	def __init__(self, log_folder=None, profile_iteration=None):
+		''' Record where the time of each generation of an experiment goes.
+
+		Each generation (see `generation`) records the wall time spent in each phase
+		(see `phase`) and totals of counters (see `count`). The number of conditionals evaluated
+		by agents simulated in this process (not in worker processes or by a BatchSimulator)
+		is counted too.
+
+		args
+		----
+			log_folder: Folder to append each generation's record to (as a line of JSON in
+				`PROFILE_FILE`), and to write cProfile statistics to. If None, records are only kept in memory.
+			profile_iteration: Iteration number (as in the results files) to also run cProfile
+				for, writing its statistics to 'profile_<iteration>.prof'. If None, cProfile isn't used.
+
+		'''
+
+		self.log_folder = log_folder
+		self.profile_iteration = profile_iteration
+		# record of each finished generation (see `end_generation`)
+		self.generations = []
+		self._current = None
+		self._conditionals = 0
+		self._cprofile = None
+
+	def generation(self, iteration):
+		''' Return a context manager which records a generation (see `start_generation` and `end_generation`).
+
+		If the generation raises an exception, counting and cProfile are stopped and it isn't recorded.
+
+		'''
+
+		return _Generation(self, iteration)
+
+	def start_generation(self, iteration):
+		''' Start recording a generation.
+
+		args
+		----
+			iteration: The iteration number (as in the results files).
+
+		'''
+
+		self._current = {'iteration': iteration, 'phases': {}, 'counters': {}}
+		compiler.set_counting(True)
+		self._conditionals = compiler.conditional_count()
+		if iteration == self.profile_iteration:
+			self._cprofile = cProfile.Profile()
+			self._cprofile.enable()
+
+	def end_generation(self):
+		''' Finish recording the current generation, writing its record to the log folder.
+
+		return
+		------
+			The generation's record - a dict of its 'iteration', and the 'phases' (name -> seconds)
+			and 'counters' (name -> total) recorded.
+
+		'''
+
+		record = self._current
+		self._current = None
+		if self._cprofile:
+			self._cprofile.disable()
+			if self.log_folder:
+				self._cprofile.dump_stats(os.path.join(self.log_folder, 'profile_' + str(record['iteration']) + '.prof'))
+			self._cprofile = None
+
+		record['counters']['conditionals'] = compiler.conditional_count() - self._conditionals
+		compiler.set_counting(False)
+
+		self.generations.append(record)
+		if self.log_folder:
+			with open(os.path.join(self.log_folder, PROFILE_FILE), 'a') as out_file:
+				out_file.write(json.dumps(record, sort_keys=True) + '\n')
+
+		return record
+
+	def abort_generation(self):
+		''' Stop recording the current generation without recording it. '''
+
+		self._current = None
+		if self._cprofile:
+			self._cprofile.disable()
+			self._cprofile = None
+		compiler.set_counting(False)
+
+	def phase(self, name):
+		''' Return a context manager which adds the time spent in it to a phase of the current generation. '''
+
+		return _Phase(self, name)
+
+	def count(self, name, amount=1):
+		''' Add to a counter of the current generation. '''
+
+		if self._current is not None:
+			counters = self._current['counters']
+			counters[name] = counters.get(name, 0) + amount
+
+	def _add_time(self, name, seconds):
+		if self._current is not None:
+			phases = self._current['phases']
+			phases[name] = phases.get(name, 0.0) + seconds
+
+# ------------------------------------------------------------------------------- #
+
+class NullProfiler():
+	''' A Profiler that records nothing, for experiments which aren't profiled. '''
+
+	def __init__(self):
+		self.generations = []
+
+	def generation(self, iteration):
+		return _NULL_PHASE
+
+	def start_generation(self, iteration):
+		pass
+
+	def end_generation(self):
+		return None
+
+	def abort_generation(self):
+		pass
+
+	def phase(self, name):
+		return _NULL_PHASE
+
+	def count(self, name, amount=1):
+		pass
+
+# ------------------------------------------------------------------------------- #
+
+class _Generation():
+	__slots__ = ('profiler', 'iteration')
+
+	def __init__(self, profiler, iteration):
+		self.profiler = profiler
+		self.iteration = iteration
+
+	def __enter__(self):
+		self.profiler.start_generation(self.iteration)
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		if exc_type is None:
+			self.profiler.end_generation()
+		else:
+			self.profiler.abort_generation()
+
+class _Phase():
+	__slots__ = ('profiler', 'name', 'start')
+
+	def __init__(self, profiler, name):
+		self.profiler = profiler
+		self.name = name
+
+	def __enter__(self):
+		self.start = default_timer()
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.profiler._add_time(self.name, default_timer() - self.start)
+
+class _NullPhase():
+	def __enter__(self):
+		pass
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		pass
+
+_NULL_PHASE = _NullPhase()
+
+def truncate_profile(folder, iteration_num):
+	''' Remove the records of iterations after `iteration_num` from the profile file of an experiment, if it has one. '''
+
+	file_name = os.path.join(folder, PROFILE_FILE)
+	if not os.path.exists(file_name):
+		return
+
+	with open(file_name) as in_file:
+		lines = in_file.readlines()
+
+	kept = [line for line in lines if line.endswith('\n') and json.loads(line)['iteration'] <= iteration_num]
+	util.write_atomically(file_name, ''.join(kept))
+
+def read_profile(folder):
+	''' Read the generation records (see `Profiler.end_generation`) written to an experiment's log folder, in order. '''
+
+	file_name = os.path.join(folder, PROFILE_FILE)
+	if not os.path.exists(file_name):
+		return []
+
+	with open(file_name) as in_file:
+		return [json.loads(line) for line in in_file if line.endswith('\n')]
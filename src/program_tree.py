@@ -3,9 +3,14 @@ from random import choice
 import util
 
 class ProgramTree():
+	# default for trees unpickled from before the node index existed (unpickling doesn't call `__init__`)
+	_nodes = None
+
 	def __init__(self, first_node):
 		self.start_node = first_node
 		self.curr_node = self.start_node
+		# list of all nodes in the tree, for random selection - built when first needed
+		self._nodes = None
 
 	def node_list(self):
 		''' Generate and return a flat list of all nodes in the tree.
@@ -29,16 +34,74 @@ class ProgramTree():
 
 		return result
 
+	def preorder(self):
+		''' Generate and return a flat list of all nodes in the tree, in preorder:
+		each node is followed by its true and false branches, or its next node. '''
+
+		result = []
+		stack = [self.start_node]
+		while len(stack) > 0:
+			curr_node = stack.pop()
+			if not curr_node:
+				continue
+
+			result.append(curr_node)
+			if curr_node.conditional:
+				stack.append(curr_node.false_branch)
+				stack.append(curr_node.true_branch)
+			else:
+				stack.append(curr_node.next_node)
+
+		return result
+
 	def random_node(self):
 		''' Return a random node from the program tree.
 
+		Nodes are chosen from an index of the tree's nodes, which is kept up to date by
+		`insert_node`. Call `reindex` after changing the tree in any other way.
+
 		return
 		------
 			A random node from the tree.
 
 		'''
 
-		return choice(self.node_list())
+		if self._nodes is None:
+			self.reindex()
+
+		return choice(self._nodes)
+
+	def reindex(self):
+		''' Rebuild the index of nodes used by `random_node`. '''
+
+		self._nodes = self.node_list()
+
+	def insert_node(self, parent, branch, new_node, child_branch=None):
+		''' Insert a new node below a node of the tree, keeping the node index up to date.
+
+		args
+		----
+			parent: The node in the tree to insert the new node below.
+			branch: The field of `parent` to link the new node to ('true_branch', 'false_branch' or 'next_node').
+			new_node: The node to insert.
+			child_branch: The field of `new_node` to move the subtree previously on `branch` to.
+				A conditional's branch it replaces is dropped.
+
+		'''
+
+		child = getattr(parent, branch)
+		setattr(parent, branch, new_node)
+		new_node.parent = parent
+
+		if child:
+			child.parent = new_node
+			setattr(new_node, child_branch, child)
+
+		if self._nodes is not None:
+			self._nodes.append(new_node)
+			if new_node.conditional:
+				# a conditional is created with a node on each branch - keep those that weren't replaced
+				self._nodes.extend(node for node in (new_node.true_branch, new_node.false_branch) if node is not child)
 
 	def __str__(self):
 		result = ''
@@ -98,14 +161,20 @@ class ProgramTree():
 		return result
 
 class ProgramTreeNode():
-	def __init__(self, parent_node, action, conditional=False):
+	def __init__(self, parent_node, action, conditional=False, true_branch=None, false_branch=None):
+		''' Create a program tree node.
+
+		A conditional node is given random movement actions for any branch not passed in.
+
+		'''
+
 		self.parent = parent_node
 		self.action = action
 		self.conditional = conditional
 
 		if conditional:
-			self.true_branch = ProgramTreeNode(self, util.random_movement_action())
-			self.false_branch = ProgramTreeNode(self, util.random_movement_action())
+			self.true_branch = true_branch or ProgramTreeNode(self, util.random_movement_action())
+			self.false_branch = false_branch or ProgramTreeNode(self, util.random_movement_action())
 		else:
 			self.next_node = None
 
@@ -0,0 +1,236 @@
+from array import array
+import os
+import struct
+import sys
+
+from simulator import Simulator
+import util
+
+# a results file is a header (magic, format version, iteration, number of agents) followed by
+# one column per field, each holding a value for every agent
+MAGIC = 'GPR'
+VERSION = 2
+HEADER = struct.Struct('<3sBII')
+# (name, array typecode, NumPy dtype) of each column, in file order
+COLUMNS = (
+	('outcome', 'B', '<u1'),
+	('distance', 'f', '<f4'),
+	('steps', 'I', '<u4'),
+	('nodes', 'I', '<u4')
+)
+
+# per-iteration summary file in an experiment's log folder, and its fields
+SUMMARY_FILE = 'summary.csv'
+SUMMARY_FIELDS = ('iteration', 'population', 'min_distance', 'mean_distance', 'p25_distance', 'median_distance',
+	'p75_distance', 'max_distance', 'goal_rate', 'caught_rate', 'mean_nodes')
+
+# outcome codes stored in results files
+OUTCOMES = (Simulator.GOAL, Simulator.CAUGHT, Simulator.STEP_LIMIT, Simulator.CYCLE)
+OUTCOME_CODES = dict((outcome, code) for code, outcome in enumerate(OUTCOMES))
+
+class ResultsLogger():
+	def __init__(self, folder, iteration_num):
+		''' Create a logger for the results of an iteration.
+
+		Results are kept in memory and written to '<iteration_num>.results' in one go by `close`.
+
+		args
+		----
+			folder: The folder to write the results file to.
+			iteration_num: The iteration number.
+
+		'''
+
+		self.file_name = os.path.join(folder, str(iteration_num) + '.results')
+		self.iteration_num = iteration_num
+		self.columns = [array(typecode) for name, typecode, dtype in COLUMNS]
+
+	def log_performance(self, outcome, distance_from_goal, steps, nodes):
+		''' Log the performance of a specific agent.
+
+		args
+		----
+			outcome: How the agent's simulation ended (see `Simulator`).
+			distance_from_goal: The agent's final distance from the goal (combined over maps, so may not be whole).
+			steps: Number of steps the agent's simulation ran for.
+			nodes: Number of nodes in the agent's genome.
+
+		'''
+
+		outcomes, distances, step_counts, node_counts = self.columns
+		outcomes.append(OUTCOME_CODES[outcome])
+		distances.append(distance_from_goal)
+		step_counts.append(steps)
+		node_counts.append(nodes)
+
+	def close(self):
+		''' Write the results file. '''
+
+		folder = os.path.dirname(self.file_name)
+		if folder and not os.path.exists(folder):
+			os.makedirs(folder)
+
+		data = [HEADER.pack(MAGIC, VERSION, self.iteration_num, len(self.columns[0]))]
+		for column in self.columns:
+			# results files are little-endian
+			if sys.byteorder == 'big':
+				column = array(column.typecode, column)
+				column.byteswap()
+			data.append(column.tostring())
+
+		util.write_atomically(self.file_name, ''.join(data))
+
+	def summary(self):
+		''' Return summary statistics of the logged results, as a dict with the keys in `SUMMARY_FIELDS`. '''
+
+		outcomes, distances, step_counts, node_counts = self.columns
+		count = len(distances)
+		ordered = sorted(distances)
+
+		return {
+			'iteration': self.iteration_num,
+			'population': count,
+			'min_distance': ordered[0] if count else 0,
+			'mean_distance': float(sum(ordered)) / count if count else 0.0,
+			'p25_distance': _percentile(ordered, 25),
+			'median_distance': _percentile(ordered, 50),
+			'p75_distance': _percentile(ordered, 75),
+			'max_distance': ordered[-1] if count else 0,
+			'goal_rate': float(outcomes.count(OUTCOME_CODES[Simulator.GOAL])) / count if count else 0.0,
+			'caught_rate': float(outcomes.count(OUTCOME_CODES[Simulator.CAUGHT])) / count if count else 0.0,
+			'mean_nodes': float(sum(node_counts)) / count if count else 0.0
+		}
+
+# ------------------------------------------------------------------------------- #
+
+def read_iteration(file_name):
+	''' Read a results file as NumPy arrays (NumPy is only needed to read results).
+
+	return
+	------
+		A dict of column name -> array of values, one per agent, including 'iteration'.
+		Outcomes are stored as codes - `OUTCOMES[code]` is the outcome.
+
+	'''
+
+	import numpy
+
+	with open(file_name, 'rb') as in_file:
+		data = in_file.read()
+
+	if len(data) < HEADER.size:
+		raise ValueError('Truncated results file.')
+	magic, version, iteration_num, count = HEADER.unpack_from(data, 0)
+	if magic != MAGIC:
+		raise ValueError('Not a results file.')
+	if version != VERSION:
+		raise ValueError('Unsupported results file version: ' + str(version))
+
+	results = {'iteration': numpy.empty(count, dtype=numpy.uint32)}
+	results['iteration'].fill(iteration_num)
+	offset = HEADER.size
+	for name, typecode, dtype in COLUMNS:
+		dtype = numpy.dtype(dtype)
+		if len(data) < offset + count * dtype.itemsize:
+			raise ValueError('Truncated results file.')
+		results[name] = numpy.frombuffer(data, dtype=dtype, count=count, offset=offset)
+		offset += count * dtype.itemsize
+
+	return results
+
+def read_results(folder):
+	''' Read the results files of every iteration of an experiment, in iteration order.
+
+	return
+	------
+		A dict of column name -> array of values, with the values of all iterations concatenated.
+		The 'iteration' column gives the iteration each value is from.
+
+	'''
+
+	import numpy
+
+	iterations = sorted(int(name[:-len('.results')]) for name in os.listdir(folder) if name.endswith('.results'))
+	parts = [read_iteration(os.path.join(folder, str(iteration) + '.results')) for iteration in iterations]
+
+	dtypes = dict((name, dtype) for name, typecode, dtype in COLUMNS)
+	dtypes['iteration'] = numpy.uint32
+
+	return dict((name, numpy.concatenate([part[name] for part in parts] or [numpy.empty(0, dtype=dtype)])) for name, dtype in dtypes.items())
+
+def append_summary(folder, summary):
+	''' Append an iteration's summary (see `ResultsLogger.summary`) to the summary file of an experiment.
+
+	Each summary is a single line, written and flushed as soon as the iteration finishes, so the
+	file can be read (see `read_summary`) while the experiment is running.
+
+	'''
+
+	file_name = os.path.join(folder, SUMMARY_FILE)
+	new_file = not os.path.exists(file_name) or os.path.getsize(file_name) == 0
+	with open(file_name, 'a') as out_file:
+		if new_file:
+			out_file.write(','.join(SUMMARY_FIELDS) + '\n')
+		out_file.write(','.join(_format(summary[field]) for field in SUMMARY_FIELDS) + '\n')
+
+def truncate_summary(folder, iteration_num):
+	''' Remove the summaries of iterations after `iteration_num` from the summary file of an experiment, if it has one. '''
+
+	file_name = os.path.join(folder, SUMMARY_FILE)
+	if not os.path.exists(file_name):
+		return
+
+	with open(file_name) as in_file:
+		lines = in_file.readlines()
+
+	kept = lines[:1] + [line for line in lines[1:] if line.strip() and float(line.split(',', 1)[0]) <= iteration_num]
+	util.write_atomically(file_name, ''.join(kept))
+
+def read_summary(folder):
+	''' Read the summary file of an experiment.
+
+	A partly written last line (from a running experiment) is ignored.
+
+	return
+	------
+		A dict of field name -> list of values, one per iteration. Empty lists if there is no summary file yet.
+
+	'''
+
+	summary = dict((field, []) for field in SUMMARY_FIELDS)
+
+	file_name = os.path.join(folder, SUMMARY_FILE)
+	if not os.path.exists(file_name):
+		return summary
+
+	with open(file_name) as in_file:
+		lines = in_file.readlines()
+
+	for line in lines[1:]:
+		values = line.strip().split(',')
+		if not line.endswith('\n') or len(values) != len(SUMMARY_FIELDS):
+			continue
+		for field, value in zip(SUMMARY_FIELDS, values):
+			summary[field].append(float(value))
+
+	return summary
+
+def _format(value):
+	''' Format a summary value - integers exactly, other values to 6 significant figures. '''
+
+	if isinstance(value, (int, long)):
+		return str(value)
+
+	return '%.6g' % value
+
+def _percentile(ordered, percent):
+	''' Return a percentile of a sorted list of values, interpolating between the closest two values. '''
+
+	if not ordered:
+		return 0.0
+
+	position = (len(ordered) - 1) * percent / 100.0
+	lower = int(position)
+	upper = min(lower + 1, len(ordered) - 1)
+
+	return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
@@ -0,0 +1,87 @@
+from bisect import bisect_right
+from random import random, randrange
+
+class RouletteSelection():
+	def __init__(self, fitness_values):
+		''' Select agents with probability proportional to their fitness.
+
+		The cumulative probabilities are worked out once, so each selection is a binary search.
+		If no agent has a positive fitness, agents are selected uniformly.
+
+		args
+		----
+			fitness_values: A list of [agent, fitness] pairs.
+
+		'''
+
+		self.agents = [agent for agent, fitness in fitness_values]
+		fitness_sum = float(sum(fitness for agent, fitness in fitness_values))
+
+		self.cumulative = []
+		weight_total = 0
+		for agent, fitness in fitness_values:
+			weight_total += (float(fitness) / fitness_sum) if fitness_sum > 0 else (1.0 / len(fitness_values))
+			self.cumulative.append(weight_total)
+
+	def select(self):
+		''' Return a randomly selected agent. '''
+
+		# rounding can leave the total just under 1
+		i = bisect_right(self.cumulative, random())
+		return self.agents[min(i, len(self.agents) - 1)]
+
+# ------------------------------------------------------------------------------- #
+
+class RankSelection(RouletteSelection):
+	def __init__(self, fitness_values):
+		''' Select agents with probability proportional to their rank by fitness.
+
+		The least fit agent has weight 1, the next 2, and so on up to the fittest, so selection
+		pressure doesn't depend on how far apart the fitness values are.
+
+		args
+		----
+			fitness_values: A list of [agent, fitness] pairs.
+
+		'''
+
+		ranked = sorted(fitness_values, key=lambda pair: pair[1])
+		RouletteSelection.__init__(self, [[agent, rank + 1] for rank, (agent, fitness) in enumerate(ranked)])
+
+# ------------------------------------------------------------------------------- #
+
+class TournamentSelection():
+	def __init__(self, fitness_values, size=2):
+		''' Select the fittest of a few agents picked uniformly at random.
+
+		args
+		----
+			fitness_values: A list of [agent, fitness] pairs.
+			size: Number of agents in each tournament. Larger tournaments favour fitter agents more.
+
+		'''
+
+		if size < 1:
+			raise ValueError('Tournaments need at least one agent.')
+
+		self.fitness_values = fitness_values
+		self.size = size
+
+	def select(self):
+		''' Return a randomly selected agent. '''
+
+		num_agents = len(self.fitness_values)
+		agent, fitness = self.fitness_values[randrange(num_agents)]
+		for i in range(self.size - 1):
+			contender, contender_fitness = self.fitness_values[randrange(num_agents)]
+			if contender_fitness > fitness:
+				agent, fitness = contender, contender_fitness
+
+		return agent
+
+# selection strategies by name
+STRATEGIES = {
+	'roulette': RouletteSelection,
+	'rank': RankSelection,
+	'tournament': TournamentSelection
+}
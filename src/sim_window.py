@@ -1,6 +1,8 @@
 import pyglet
 import pyglet.window.key as key
 
+from simulator import Simulator
+
 class SimWindow(pyglet.window.Window):
 	TILE_SIDE_LEN = 50
 	NON_TRAVERSABLE_COL = (0, 0, 0, 0)
@@ -9,129 +11,154 @@ class SimWindow(pyglet.window.Window):
 	AGENT_COL = (255, 255, 0, 255)
 	GUARD_COL = (100, 100, 100, 255)
 	DETECTION_ZONE_COL = (255, 0, 0, 200)
+	GRID_COL = (215, 196, 196, 200)
+	# largest window (in pixels) tiles are shrunk to fit large maps into
+	MAX_WINDOW_SIDE_LEN = 1000
+	# smallest tile size (in pixels) grid lines are drawn for
+	MIN_GRID_TILE_SIDE_LEN = 4
 
-	def __init__(self, agent, guard, environment, max_steps=0, graphics_on=True):
+	def __init__(self, agent, guard, environment, max_steps=0, graphics_on=True, tile_side_len=None):
 		''' Create a simulation window.
 
+		The simulation itself is run by a `Simulator`; the window only steps it
+		on the pyglet clock and draws the result.
+
+		The map is drawn from a single batch: one coloured quad per tile and the grid lines,
+		built once. Each frame only the tiles whose agent, guard or detection state changed
+		are recoloured.
+
 		args
 		----
 			agent: The agent in the environment.
-			environment: A tuple of tuples, where each inner tuple is a row of the map.
+			guard: The guard in the environment, or None.
+			environment: The Map the agent and guard are in.
 			max_steps: Maximum number of game loops to execute before finishing the simulation.
 				If set to 0, number of steps is unlimited.
 			graphics_on: True if graphics should be displayed.
+			tile_side_len: Size of a tile in pixels. If None, `TILE_SIDE_LEN`, or smaller
+				if needed to fit the map in a `MAX_WINDOW_SIDE_LEN` window.
 
 		'''
 
 		self.graphics_on = graphics_on
-		if self.graphics_on:
-			width = len(environment.tiles[0]) * SimWindow.TILE_SIDE_LEN
-			height = len(environment.tiles) * SimWindow.TILE_SIDE_LEN
-
-			pyglet.window.Window.__init__(self, width=width, height=height)
-
-		pyglet.clock.schedule(self.update)
-
-		self.max_steps = max_steps
-		self.step = 0
+		# a replay shows every step, and arrow keys move the agent outside the simulation's steps
+		self.simulator = Simulator(agent, guard, environment, max_steps, detect_cycles=False)
 		self.environment = environment
 		self.agent = agent
 		self.guard = guard
-		self.finished = False
 
-	def check_win(self):
-		''' Check if the agent has reached the goal. '''
+		if self.graphics_on:
+			if tile_side_len is None:
+				tile_side_len = max(1, min(SimWindow.TILE_SIDE_LEN, SimWindow.MAX_WINDOW_SIDE_LEN // max(environment.cols, environment.rows, 1)))
+			self.tile_side_len = tile_side_len
 
-		if self.agent.tile.is_goal:
-			return True
-		return False
+			width = environment.cols * tile_side_len
+			height = environment.rows * tile_side_len
+			pyglet.window.Window.__init__(self, width=width, height=height)
 
-	def check_detection(self):
-		''' Check if the agent has been detected. '''
+			self._create_batch()
 
-		if self.agent.tile.detection:
-			return True
-		return False
+		pyglet.clock.schedule(self.update)
 
-	def update(self, dt):
-		''' Update the simulation. '''
+	@property
+	def finished(self):
+		''' True once the simulation has finished. '''
 
-		if self.finished:
-			return
-
-		# print '   step ' + str(self.step)
+		return self.simulator.finished
 
-		self.agent.update()
-		if self.guard:
-			self.guard.update()
+	def update(self, dt):
+		''' Update the simulation. '''
 
-		if self.check_win():
+		if self.simulator.step():
 			self.on_draw() # need to force a last draw because of execution order
-			self.finished = True
-# 			print 'Reached goal!'
-		elif self.check_detection():
-			self.on_draw() # need to force a last draw because of execution order
-			self.finished = True
-# 			print 'Got caught...'
-
-		# check if the maximum number of game loops have been executed
-		self.step += 1
-		if (self.max_steps > 0) and (self.step == self.max_steps):
-# 			print 'Reached step limit.'
-			self.finished = True
-
-		if self.finished:
+			pyglet.clock.unschedule(self.update)
 			pyglet.app.exit()
 
 	def on_draw(self):
-		''' Create an image for each tile and draw it. '''
+		''' Recolour the tiles that changed since the last frame and draw the map. '''
 
 		if (not self.graphics_on):
 			return
 
-		self.clear()
+		self._update_tiles()
 
-		# draw map
-		y = self.height
-		for row in self.environment.tiles:
-			y -= SimWindow.TILE_SIDE_LEN
-			x = 0
-			for tile in row:
-				pattern = pyglet.image.SolidColorImagePattern(SimWindow.TRAVERSABLE_COL)
-				if not tile.traversable:
-					pattern = pyglet.image.SolidColorImagePattern(SimWindow.NON_TRAVERSABLE_COL)
-				if tile.detection:
-					pattern = pyglet.image.SolidColorImagePattern(SimWindow.DETECTION_ZONE_COL)
-				if tile.has_guard:
-					pattern = pyglet.image.SolidColorImagePattern(SimWindow.GUARD_COL)
-				if tile.is_goal:
-					pattern = pyglet.image.SolidColorImagePattern(SimWindow.GOAL_COL)
-				if tile.has_agent:
-					pattern = pyglet.image.SolidColorImagePattern(SimWindow.AGENT_COL)
-
-				image = pyglet.image.create(SimWindow.TILE_SIDE_LEN, SimWindow.TILE_SIDE_LEN, pattern)
-				pyglet.sprite.Sprite(image, x, y).draw()
-
-				x += SimWindow.TILE_SIDE_LEN
-
-		# draw grid lines
-		# horizontal lines
-		y = 0
-		while (y <= self.height):
-			y += SimWindow.TILE_SIDE_LEN
-
-			pattern = pyglet.image.SolidColorImagePattern((215, 196, 196, 200))
-			image = pyglet.image.create(self.width, 1, pattern)
-			pyglet.sprite.Sprite(image, 0, y).draw()
-
-		# vertical lines
-		x = 0
-		while (x <= self.width):
-			x += SimWindow.TILE_SIDE_LEN
-
-			pattern = pyglet.image.SolidColorImagePattern((215, 196, 196, 200))
-			image = pyglet.image.create(1, self.height, pattern)
-			pyglet.sprite.Sprite(image, x, 0).draw()
+		self.clear()
+		self.batch.draw()
+
+	def _create_batch(self):
+		''' Build the batch the map is drawn from - a quad per tile, and the grid lines above them. '''
+
+		environment = self.environment
+		side = self.tile_side_len
+		num_tiles = environment.rows * environment.cols
+
+		self.batch = pyglet.graphics.Batch()
+
+		vertices = []
+		colours = []
+		for index in range(num_tiles):
+			row, col = divmod(index, environment.cols)
+			# rows are numbered from the top of the map
+			x = col * side
+			y = self.height - (row + 1) * side
+			vertices.extend((x, y, x + side, y, x + side, y + side, x, y + side))
+			colours.extend(_QUAD_COLOURS[self._base_colour(index)])
+		self.tile_quads = self.batch.add(4 * num_tiles, pyglet.gl.GL_QUADS, _BlendGroup(0), ('v2i/static', vertices), ('c4B/dynamic', colours))
+
+		# grid lines - left out when tiles are too small for them to leave the tiles visible
+		self.grid_lines = None
+		if side >= SimWindow.MIN_GRID_TILE_SIDE_LEN:
+			vertices = []
+			for y in range(0, self.height + 1, side):
+				vertices.extend((0, y, self.width, y))
+			for x in range(0, self.width + 1, side):
+				vertices.extend((x, 0, x, self.height))
+			num_vertices = len(vertices) // 2
+			self.grid_lines = self.batch.add(num_vertices, pyglet.gl.GL_LINES, _BlendGroup(1), ('v2i/static', vertices), ('c4B/static', SimWindow.GRID_COL * num_vertices))
+
+		# tiles currently coloured for the agent, guard or detection zone
+		self._highlighted = set()
+		# the detection zones of a map without a guard don't change during the simulation
+		self._static_detection_zone = None if self.simulator.schedule else self.simulator.detection_zone()
+
+	def _update_tiles(self):
+		''' Recolour the tiles whose agent, guard or detection state changed since the last frame. '''
+
+		# the guard's position and detection zone come from the simulation, not the map
+		detection_zone = self._static_detection_zone
+		if detection_zone is None:
+			detection_zone = self.simulator.detection_zone()
+		guard_position = self.simulator.guard_position()
+
+		highlighted = set(detection_zone)
+		highlighted.add(self.agent.index)
+		if guard_position >= 0:
+			highlighted.add(guard_position)
+
+		colours = self.tile_quads.colors
+		for index in highlighted | self._highlighted:
+			colour = self._base_colour(index)
+			if index in detection_zone:
+				colour = SimWindow.DETECTION_ZONE_COL
+			if index == guard_position:
+				colour = SimWindow.GUARD_COL
+			if self.environment.is_goal[index]:
+				colour = SimWindow.GOAL_COL
+			if index == self.agent.index:
+				colour = SimWindow.AGENT_COL
+			colours[index * 16:(index + 1) * 16] = _QUAD_COLOURS[colour]
+
+		self._highlighted = highlighted
+
+	def _base_colour(self, index):
+		''' Return the colour of a tile without the agent, guard or detection zones on it. '''
+
+		if self.environment.is_goal[index]:
+			return SimWindow.GOAL_COL
+		if self.environment.traversable[index]:
+			return SimWindow.TRAVERSABLE_COL
+
+		return SimWindow.NON_TRAVERSABLE_COL
 
 	def on_key_press(self, symbol, modifiers):
 		''' Handle keyboard input.
@@ -155,3 +182,18 @@ class SimWindow(pyglet.window.Window):
 		elif symbol == key.RIGHT:
 			self.agent.move_east()
 
+# ------------------------------------------------------------------------------- #
+
+class _BlendGroup(pyglet.graphics.OrderedGroup):
+	''' A group drawn (in order) with alpha blending, so colours with transparency blend with those below. '''
+
+	def set_state(self):
+		pyglet.gl.glEnable(pyglet.gl.GL_BLEND)
+		pyglet.gl.glBlendFunc(pyglet.gl.GL_SRC_ALPHA, pyglet.gl.GL_ONE_MINUS_SRC_ALPHA)
+
+	def unset_state(self):
+		pyglet.gl.glDisable(pyglet.gl.GL_BLEND)
+
+# colour -> vertex colours of a tile's quad in that colour
+_QUAD_COLOURS = dict((colour, colour * 4) for colour in (SimWindow.NON_TRAVERSABLE_COL, SimWindow.TRAVERSABLE_COL,
+	SimWindow.GOAL_COL, SimWindow.AGENT_COL, SimWindow.GUARD_COL, SimWindow.DETECTION_ZONE_COL))
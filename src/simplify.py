@@ -0,0 +1,124 @@
+from array import array
+
+from genome import Genome, OPCODES
+
+# queries which, when true, mean another query must be false
+IMPLIED_FALSE = {
+	OPCODES['goal_west']: OPCODES['goal_east'],
+	OPCODES['goal_east']: OPCODES['goal_west'],
+	OPCODES['goal_north']: OPCODES['goal_south'],
+	OPCODES['goal_south']: OPCODES['goal_north']
+}
+
+def simplify(genome):
+	''' Create a simplified copy of a genome which behaves identically.
+
+	All the conditionals evaluated in a single step see the same state, so within one chain
+	of conditionals (up to the next action):
+		A conditional whose result is already known is replaced by the branch it would take
+			(e.g. a `north_blocked` check inside the true branch of another `north_blocked` check).
+		A conditional whose branches are identical (once simplified) is replaced by that branch.
+
+	Actions are never removed - even one which can't move the agent takes up a step,
+	during which the guard moves.
+
+	args
+	----
+		genome: The Genome to simplify. It is not changed.
+
+	return
+	------
+		The simplified Genome.
+
+	'''
+
+	if len(genome) == 0:
+		return genome.copy()
+
+	ops, sizes = _simplify(genome, 0, {})
+	return Genome(array('B', ops), array('I', sizes))
+
+def _simplify(genome, i, facts):
+	''' Simplify the subtree starting at node `i`.
+
+	Works through the subtree with an explicit stack rather than recursion, so deeply nested
+	genomes can be simplified. Each subtree's simplified nodes are built once both of its
+	branches have been.
+
+	args
+	----
+		genome: The Genome being simplified.
+		i: Index of the root of the subtree.
+		facts: Results of queries known when node `i` is reached, as an {opcode: result} dict.
+
+	return
+	------
+		Lists of the opcodes and subtree sizes of the simplified subtree.
+
+	'''
+
+	# simplified (ops, sizes) of finished subtrees, waiting to be combined by their parent
+	results = []
+	# ('visit', node index, facts) to simplify a subtree, or ('combine', chain, query) to join
+	# the last two results as the branches of a conditional below a chain of actions
+	stack = [('visit', i, facts)]
+
+	while stack:
+		frame = stack.pop()
+		if frame[0] == 'combine':
+			chain, query = frame[1], frame[2]
+			false_ops, false_sizes = results.pop()
+			true_ops, true_sizes = results.pop()
+			if (true_ops, true_sizes) == (false_ops, false_sizes):
+				ops, sizes = true_ops, true_sizes
+			else:
+				ops = [query] + true_ops + false_ops
+				sizes = [1 + len(true_ops) + len(false_ops)] + true_sizes + false_sizes
+			results.append(_prepend_chain(chain, ops, sizes))
+			continue
+
+		i, facts = frame[1], frame[2]
+		# follow actions and conditionals with known results down to the first conditional which must be kept
+		chain = []
+		while True:
+			if genome.conditional(i):
+				known = facts.get(genome.ops[i])
+				if known is None:
+					break
+				i = genome.true_branch(i) if known else genome.false_branch(i)
+			elif genome.sizes[i] > 1:
+				chain.append(genome.ops[i])
+				i += 1
+				# the next node is reached in a later step, when nothing is known
+				facts = {}
+			else:
+				break
+
+		if genome.conditional(i):
+			query = genome.ops[i]
+			# the true branch is simplified (and its result added) first
+			stack.append(('combine', chain, query))
+			stack.append(('visit', genome.false_branch(i), _assume(facts, query, False)))
+			stack.append(('visit', genome.true_branch(i), _assume(facts, query, True)))
+		else:
+			results.append(_prepend_chain(chain, [genome.ops[i]], [1]))
+
+	return results[0]
+
+def _prepend_chain(chain, ops, sizes):
+	''' Return the opcodes and subtree sizes of a chain of actions followed by a simplified subtree. '''
+
+	# each action in the chain is followed by the rest of the chain
+	chain_sizes = range(len(chain) + len(ops), len(ops), -1)
+
+	return chain + ops, chain_sizes + sizes
+
+def _assume(facts, query, result):
+	''' Return a copy of `facts`, with the result of `query` (and anything it implies) added. '''
+
+	facts = dict(facts)
+	facts[query] = result
+	if result and (query in IMPLIED_FALSE):
+		facts[IMPLIED_FALSE[query]] = False
+
+	return facts
@@ -0,0 +1,158 @@
+from agent import GuardSchedule
+
+class Simulator():
+	# possible outcomes of a simulation
+	GOAL = 'goal'
+	CAUGHT = 'caught'
+	STEP_LIMIT = 'step_limit'
+	CYCLE = 'cycle'
+
+	def __init__(self, agent, guard, environment, max_steps=0, detect_cycles=True):
+		''' Create a simulation of an agent (and optional guard) in an environment.
+
+		The simulation is stepped in a plain loop, so it needs neither a display nor pyglet.
+		The guard's movement is looked up from its GuardSchedule rather than simulated, so the
+		map isn't changed by the guard and the guard always starts from its starting position.
+
+		The agent's tile, its position in its program and the guard's phase are the whole state
+		of the simulation, so once a state repeats the simulation is stuck in a loop. With a step
+		limit, whole repeats of the loop are skipped (ending in the same state as running them);
+		without one, the simulation finishes with the `CYCLE` outcome.
+
+		args
+		----
+			agent: The agent in the environment.
+			guard: The guard in the environment (or a GuardSchedule made from it), or None.
+			environment: The Map the agent and guard are in.
+			max_steps: Maximum number of game loops to execute before finishing the simulation.
+				If set to 0, number of steps is unlimited.
+			detect_cycles: False to always run every step.
+
+		'''
+
+		self.agent = agent
+		self.guard = guard
+		self.environment = environment
+		self.max_steps = max_steps
+		self.steps = 0
+		# steps counted in `steps` but skipped rather than run (see `_check_cycle`)
+		self.skipped_steps = 0
+		self.finished = False
+		self.outcome = None
+
+		self.schedule = None
+		# phase of the guard's movement (see `GuardSchedule`)
+		self.phase = 0
+		if guard:
+			self.schedule = guard if isinstance(guard, GuardSchedule) else GuardSchedule(guard)
+			self.agent.guard_position = self.schedule.positions[0]
+
+		# step at which each state was reached, keyed by the state packed into an int
+		self._states = {} if detect_cycles else None
+		self._num_pcs = len(agent.genome) + 1 if agent.genome else 1
+		self._num_phases = len(self.schedule.positions) if self.schedule else 1
+
+	def check_win(self):
+		''' Check if the agent has reached the goal. '''
+
+		return bool(self.environment.is_goal[self.agent.index])
+
+	def check_detection(self):
+		''' Check if the agent has been detected. '''
+
+		if self.schedule:
+			return self.agent.index in self.schedule.detection[self.phase]
+
+		return bool(self.environment.detection[self.agent.index])
+
+	def guard_position(self):
+		''' Return the index of the tile the guard is on, or -1 if there is no guard. '''
+
+		if self.schedule:
+			return self.schedule.positions[self.phase]
+
+		return -1
+
+	def detection_zone(self):
+		''' Return the indices of the tiles the agent would currently be detected on. '''
+
+		if self.schedule:
+			return self.schedule.detection[self.phase]
+
+		detection = self.environment.detection
+		return frozenset(index for index in range(len(detection)) if detection[index])
+
+	def step(self):
+		''' Execute a single game loop: move the agent, then the guard, then check for the end of the simulation.
+
+		return
+		------
+			True if the simulation has finished.
+
+		'''
+
+		if self.finished:
+			return True
+
+		self.agent.update()
+		if self.schedule:
+			self.phase = self.schedule.next_phase(self.phase)
+			self.agent.guard_position = self.schedule.positions[self.phase]
+
+		if self.check_win():
+			self.finished = True
+			self.outcome = Simulator.GOAL
+		elif self.check_detection():
+			self.finished = True
+			self.outcome = Simulator.CAUGHT
+
+		self.steps += 1
+		if (not self.finished) and (self._states is not None):
+			self._check_cycle()
+
+		# check if the maximum number of game loops have been executed
+		if (not self.finished) and (self.max_steps > 0) and (self.steps == self.max_steps):
+			self.finished = True
+			self.outcome = Simulator.STEP_LIMIT
+
+		return self.finished
+
+	def _check_cycle(self):
+		''' Check if the simulation has returned to an earlier state, skipping or finishing the loop if so. '''
+
+		state = (self.agent.index * self._num_pcs + self.agent.pc) * self._num_phases + self.phase
+		seen = self._states.get(state)
+		if seen is None:
+			self._states[state] = self.steps
+			return
+
+		period = self.steps - seen
+		if self.max_steps > 0:
+			# the state after the skipped loops is the current state
+			skipped = ((self.max_steps - self.steps) // period) * period
+			self.steps += skipped
+			self.skipped_steps += skipped
+			self._states = None
+		else:
+			self.finished = True
+			self.outcome = Simulator.CYCLE
+
+	def run(self):
+		''' Step the simulation until it finishes.
+
+		return
+		------
+			The outcome of the simulation (one of `GOAL`, `CAUGHT`, `STEP_LIMIT` or `CYCLE`).
+
+		'''
+
+		step = self.step
+		while not step():
+			pass
+
+		return self.outcome
+
+	def distance_from_goal(self):
+		''' Return the manhattan distance from the agent to the goal. '''
+
+		return self.environment.distance(self.agent.index, self.environment.goal_index)
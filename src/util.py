@@ -1,6 +1,8 @@
 from random import choice, randint
+import hashlib
+import os
 
-from map import Map
+from map import Map, COMPILED_VERSION
 from program_tree import ProgramTree, ProgramTreeNode
 
 # action -> python code mappings
@@ -27,6 +29,12 @@ QUERY_MAPPINGS = {
 	'goal_south': 'self.goal_south()'
 }
 
+# fixed orderings of the actions and queries above, used to number them in compact program representations
+ACTIONS = ('north', 'south', 'west', 'east')
+QUERIES = ('north_blocked', 'south_blocked', 'west_blocked', 'east_blocked',
+	'guard_west', 'guard_east', 'guard_north', 'guard_south',
+	'goal_west', 'goal_east', 'goal_north', 'goal_south')
+
 def create_move(program_tree_node):
 	''' Create the text of a `my_move` method for an agent based on an action.
 
@@ -91,36 +99,24 @@ def random_program_tree(num_nodes):
 			action = choice(ACTION_MAPPINGS.keys())
 		else:
 			action = choice(QUERY_MAPPINGS.keys())
-		parent = choice(tree.node_list())
+		parent = tree.random_node()
 		new_node = ProgramTreeNode(parent, action, conditional=action in QUERY_MAPPINGS.keys())
-		# create link in other direction (parent -> new node)
-		# link parent to new node, store any existing child node
-		child = None
+		# link parent to new node, moving any existing child node below the new node
 		if parent.conditional:
-			# parent is conditional - check for child on a random fork
-			true_branch = choice([True, False])
-			if true_branch:
-				child = parent.true_branch
-				parent.true_branch = new_node
-			else:
-				child = parent.false_branch
-				parent.false_branch = new_node
+			# parent is conditional - insert on a random fork
+			branch = choice(['true_branch', 'false_branch'])
 		else:
-			child = parent.next_node
-			parent.next_node = new_node
+			branch = 'next_node'
 
-		# if an existing child was found, link it to the new node
-		if child:
-			child.parent = new_node
+		child_branch = None
+		if getattr(parent, branch):
 			if new_node.conditional:
 				# new_node is conditional - randomly select fork to link child to
-				true_branch = choice([True, False])
-				if true_branch:
-					new_node.true_branch = child
-				else:
-					new_node.false_branch = child
+				child_branch = choice(['true_branch', 'false_branch'])
 			else:
-				new_node.next_node = child
+				child_branch = 'next_node'
+
+		tree.insert_node(parent, branch, new_node, child_branch)
 
 	return tree
 
@@ -178,12 +174,16 @@ def random_movement_action():
 
 	return choice(ACTION_MAPPINGS.keys())
 
-def create_map(file_name):
+def create_map(file_name, cache_folder=None):
 	''' Create a Map object using the map stored in a given file.
 
 	args
 	----
 		file_name: Name of the map file.
+		cache_folder: Folder to keep compiled maps in (see `Map.to_bytes`), named by a hash of the
+			map file's contents and the compiled format's version. A map found there is loaded instead
+			of parsing the map file; otherwise (or if the compiled map can't be read) the map is parsed
+			and compiled into the folder. If None, maps are always parsed.
 
 	return
 	------
@@ -191,16 +191,64 @@ def create_map(file_name):
 
 	'''
 
+	with open(file_name, 'rb') as f:
+		text = f.read()
+
+	compiled_file = None
+	if cache_folder:
+		compiled_file = os.path.join(cache_folder, hashlib.sha1(text).hexdigest() + '-v' + str(COMPILED_VERSION) + '.map')
+		if os.path.exists(compiled_file):
+			with open(compiled_file, 'rb') as f:
+				data = f.read()
+			try:
+				return Map.from_bytes(data)
+			except ValueError:
+				# a damaged compiled map is replaced
+				pass
+
 	map_data = []
-	with open(file_name) as f:
-		for line in f:
-			if line.startswith('#'):
-				continue
-			elif '#' in line:
-				line = line[0:line.index('#')]
+	for line in text.splitlines():
+		if line.startswith('#'):
+			continue
+		elif '#' in line:
+			line = line[0:line.index('#')]
+
+		row = list(line.strip())
+		map_data.append(tuple(row))
+
+	game_map = Map(tuple(map_data))
+
+	if compiled_file:
+		try:
+			os.makedirs(cache_folder)
+		except OSError:
+			# another process may have created it first
+			if not os.path.isdir(cache_folder):
+				raise
+		write_atomically(compiled_file, game_map.to_bytes())
 
-			row = list(line.strip())
-			map_data.append(tuple(row))
+	return game_map
 
-	return Map(tuple(map_data))
+def write_atomically(file_name, data):
+	''' Write data to a file, so that the file is either left as it was or completely written.
+
+	The data is written to a temporary file next to the file, which is then renamed over it.
+
+	args
+	----
+		file_name: Name of the file to write.
+		data: The string to write.
+
+	'''
 
+	# named by process, so processes writing the same file at once don't share a temporary file
+	temp_name = file_name + '.' + str(os.getpid()) + '.tmp'
+	with open(temp_name, 'wb') as f:
+		f.write(data)
+		f.flush()
+		os.fsync(f.fileno())
+
+	if os.name == 'nt' and os.path.exists(file_name):
+		# renaming doesn't replace an existing file on Windows
+		os.remove(file_name)
+	os.rename(temp_name, file_name)